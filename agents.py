@@ -1,28 +1,40 @@
 # agents.py
 
+# Researcher status, stored as a small int
+LAZY = 0
+EAGER = 1
+STATUS_NAMES = ("L", "E")  # status -> key of the REVIEW_TIME table
+
 class Researcher:
+    __slots__ = ("unique_id", "model", "status", "prev_status", "num_tokens", "papers_to_submit", "papers_to_review",
+                 "max_yearly_reviews", "yearly_reviews", "yearly_generations", "next_paper_step")
+
     def __init__(self, unique_id, max_yearly_reviews, model):
         self.unique_id = unique_id
         self.model = model
-        self.status = "L"  # Lazy
-        self.prev_status = "L"  # Lazy
+        self.status = LAZY
+        self.prev_status = LAZY
         self.num_tokens = model.initial_tokens
         self.papers_to_submit = []
-        self.papers_to_review = []
-        self.reviews_done = []
-        self.papers_submitted = []
+        self.papers_to_review = []  # (paper_id, scheduled_step, status, accepted_step)
         self.max_yearly_reviews = max_yearly_reviews
+        self.yearly_reviews = 0  # reviews accepted in the last 365 days
+        self.yearly_generations = 0  # papers generated in the last 365 days
+        self.next_paper_step = None
 
     def step(self):
         self.model.agent_actions(self)
 
 class Paper:
+    __slots__ = ("ID", "generation_step", "submission_step", "author_id", "num_reviews", "reviewers", "num_invites",
+                 "num_reviews_done")
+
     def __init__(self, ID, generation_step, submission_step, author_id, num_reviews):
         self.ID = ID
         self.generation_step = generation_step
         self.submission_step = submission_step
         self.author_id = author_id
         self.num_reviews = num_reviews
-        self.reviewers = []
-        self.reviewers_invited = []
+        self.reviewers = []  # (reviewer_id, step of the review or -1 if not done yet)
         self.num_invites = 0
+        self.num_reviews_done = 0
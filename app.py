@@ -1,9 +1,17 @@
+import os
+import json
+import time
 import solara
-from mesa.visualization import SolaraViz, make_plot_component
+from mesa.visualization import make_plot_component
+from mesa.visualization.utils import force_update, update_counter
 import mesa.visualization.solara_viz as solviz
 from model import JournalModel
+from background import BackgroundRunner
+from ensemble import EnsembleStats
+from sweep import make_runs, ensemble_path
 
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 plt.rcParams["figure.figsize"] = (8, 4)
 
 from matplotlib import colormaps
@@ -100,7 +108,7 @@ def UserInputs(user_params, on_change=None):
         else:
             raise ValueError(f"{input_type} is not a supported input type")
 
-# Override the default UserInputs in SolaraViz
+# Override the default UserInputs of Mesa's visualization
 solviz.UserInputs = UserInputs
 
 # Define user-adjustable parameters
@@ -179,18 +187,20 @@ model_params = {
         "values": ["Yes","No"],
         "label": "Enable max n. of yearly reviews per author",
     },
+    "defer_population": True,
 }
 
-# Instantiate model with default values
+# Instantiate model with default values; the researchers are built by the first step (in the background
+# worker), so that starting the server and resetting the model are immediate
 model = JournalModel(
     num_authors=model_params["num_authors"]["value"],
     initial_tokens=model_params["initial_tokens"]["value"],
     daily_submission_prob=model_params["daily_submission_prob"]["value"],
     prob_accept_L=model_params["prob_accept_L"]["value"],
     prob_accept_E=model_params["prob_accept_E"]["value"],
+    defer_population=True,
 )
 
-# Enable automatic stepping in SolaraViz
 model.running = True
 
 # Create a single line plot with two series and legend via post_process
@@ -237,17 +247,152 @@ Invites = make_plot_component(
     )
 )
 
-# Build the SolaraViz page
-page = SolaraViz(
-    model,
-    components=[Queue,
-                # Reviews,Papers,Delta,
-                Stats,Invites,
-                # Perc,Tokens
-                ],
-    model_params=model_params,
-    name="Token-based peer-review",
+# Simulation controls: the model is stepped by a background worker, and the plots are redrawn
+# every "redraw every" days, at most REDRAW_RATE times per second
+REDRAW_RATE = 2
 
+@solara.component
+def BackgroundController(model, model_parameters):
+    runner = solara.use_memo(lambda: BackgroundRunner(model.value), dependencies=[model.value])
+    running, set_running = solara.use_state(False)
+    days = solara.use_reactive(365)
+    redraw_days = solara.use_reactive(30)
+    update_counter.get()  # refresh the day counter with the plots
+
+    # stop the worker of a model that is replaced
+    solara.use_effect(lambda: runner.stop, [runner])
+
+    def poll():
+        last_redraw = runner.model.global_step
+        while runner.running:
+            time.sleep(1 / REDRAW_RATE)
+            if runner.model.global_step - last_redraw >= redraw_days.value:
+                last_redraw = runner.model.global_step
+                force_update()
+        force_update()
+        set_running(False)
+
+    solara.lab.use_task(poll, dependencies=[running, runner], prefer_threaded=True)
+
+    def start(num_days=None):
+        runner.start(num_days)
+        set_running(True)
+
+    def do_step():
+        runner.step()
+        force_update()
+
+    def do_reset():
+        runner.stop()
+        set_running(False)
+        model.value = JournalModel(**model_parameters.value)
+
+    with solara.Row(justify="space-between"):
+        solara.Button(label="Reset", color="primary", on_click=do_reset)
+        solara.Button(label="❚❚" if running else "▶", color="primary",
+                      on_click=(lambda: runner.stop(wait=False)) if running else (lambda: start()), disabled=not running and not runner.model.running)
+        solara.Button(label="Step", color="primary", on_click=do_step, disabled=running or not runner.model.running)
+    with solara.Row():
+        solara.InputInt("Days", value=days, continuous_update=True)
+        solara.Button(label="Run", color="primary", on_click=lambda: start(days.value), disabled=running or not runner.model.running)
+    solara.InputInt("Redraw every (days)", value=redraw_days, continuous_update=True)
+    solara.Markdown(f"**Day:** {runner.model.global_step}" + (f" ({runner.days_per_second():.1f} days/s)" if runner.model.global_step > runner.start_step else ""))
+    if runner.error is not None:
+        solara.Error(f"The simulation stopped: {runner.error!r}")
+
+
+# Ensembles of runs (python sweep.py --ensemble): the mean of each series, in a band between the lowest
+# and highest quantile of the runs, reloaded as new runs are added
+ENSEMBLE_RELOAD_INTERVAL = 2  # seconds between the checks for new runs
+ENSEMBLE_CHARTS = (
+    ("Editorial Queue", (("Submitted", "Queue size", css["editor"], "-"),
+                         ("Submitted waiting reviewers", "Papers waiting for Reviewers", css["waitingRev"], "-"),
+                         ("Submitted in review", "Papers under Review", css["underRev"], "-"))),
+    ("Average times", (("Avg reviewing time 1y", "Reviewing time (1y avg)", css["done"], "-"),
+                       ("Avg reviewing time 1m", "Reviewing time (1m avg)", css["done"], "--"))),
+    ("Invites per Paper", (("Avg invites per paper 1y", "Invites per Paper (avg 1y)", css["waitingRev"], "-"),
+                           ("Avg invites per paper 1m", "Invites per Paper (avg 1m)", css["waitingRev"], "--"))),
 )
 
-page  # run with: solara run app.py
\ No newline at end of file
+
+def ensemble_files(path):
+    # maps the combinations of values of a sweep directory (or a single file) to their ensemble files
+    if os.path.isfile(path):
+        return {os.path.basename(path): path}
+    try:
+        with open(os.path.join(path, "sweep.json")) as f:
+            definition = json.load(f)
+    except OSError:
+        return {}
+    replicates = definition["replicates"]
+    runs = make_runs(definition["grid"], replicates, definition["seed"], definition["fixed"])
+    files = {}
+    for combination in range(len(runs) // replicates):
+        params = runs[combination * replicates]["params"]
+        label = ", ".join(f"{name}={params[name]}" for name in definition["grid"]) or "all runs"
+        files[label] = ensemble_path(path, combination)
+    return files
+
+
+@solara.component
+def EnsembleCharts(path):
+    version, set_version = solara.use_state(0)
+
+    def watch(cancel):
+        last_modified, reloads = None, 0
+        while True:
+            modified = os.path.getmtime(path) if os.path.exists(path) else None
+            if modified != last_modified:
+                last_modified, reloads = modified, reloads + 1
+                set_version(reloads)
+            if cancel.wait(ENSEMBLE_RELOAD_INTERVAL):
+                return
+
+    solara.use_thread(watch, dependencies=[path], intrusive_cancel=False)
+    stats = solara.use_memo(lambda: EnsembleStats.load(path)[0] if os.path.exists(path) else None, dependencies=[path, version])
+    if stats is None:
+        solara.Info("No run of this ensemble has completed yet")
+        return
+    table = stats.to_dataframe()
+    low, high = stats.quantiles.min(), stats.quantiles.max()
+    stopped = f", {table['Runs stopped'].iloc[-1]} of them stopped early and carried forward" if table["Runs stopped"].iloc[-1] else ""
+    solara.Markdown(f"**Runs:** {table['Runs'].max()}{stopped}; bands from the {low:.0%} to the {high:.0%} quantile")
+    for title, series in ENSEMBLE_CHARTS:
+        fig = Figure()
+        ax = fig.subplots()
+        for column, label, color, style in series:
+            ax.plot(table["Step"], table[f"{column} mean"], color=color, linestyle=style, label=label)
+            ax.fill_between(table["Step"], table[f"{column} {low:.0%}"], table[f"{column} {high:.0%}"], color=color, alpha=0.2, linewidth=0)
+        ax.set_title(title)
+        ax.set_xlabel("Day")
+        ax.legend(loc="upper left")
+        solara.FigureMatplotlib(fig)
+
+
+@solara.component
+def Page():
+    current_model = solara.use_reactive(model)
+    model_parameters = solara.use_reactive({})
+    ensemble_source = solara.use_reactive("")
+    ensemble = solara.use_reactive(None)
+    files = ensemble_files(ensemble_source.value) if ensemble_source.value else {}
+    with solara.AppBar():
+        solara.AppBarTitle("Token-based peer-review")
+    with solara.Sidebar(), solara.Column():
+        with solara.Card("Controls"):
+            BackgroundController(current_model, model_parameters)
+        with solara.Card("Model Parameters"):
+            solviz.ModelCreator(current_model, model_params, model_parameters=model_parameters)
+        with solara.Card("Ensemble"):
+            solara.InputText("Sweep directory or ensemble file", value=ensemble_source)
+            if len(files) > 1:
+                solara.Select("Values", value=ensemble, values=list(files))
+    solviz.ComponentsView([Queue,
+                           # Reviews,Papers,Delta,
+                           Stats,Invites,
+                           # Perc,Tokens
+                           ], current_model.value)
+    if files:
+        EnsembleCharts(files.get(ensemble.value, next(iter(files.values()))))
+
+page = Page()  # run with: solara run app.py
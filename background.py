@@ -0,0 +1,65 @@
+# background.py
+
+import threading
+import time
+
+
+class BackgroundRunner:
+    """Steps a model in a worker thread, so that the web interface stays responsive.
+
+    The interface keeps reading the model's metrics while the worker runs, and polls
+    `model.global_step` to decide when to redraw; rows are appended to the metrics store only
+    once complete, so a reader never sees a partial day. Steps are serialized by a lock, so
+    step() from the interface thread cannot interleave with the worker.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.stop_requested = threading.Event()
+        self.thread = None
+        self.target_step = None  # the worker stops at this step; None to run until stopped
+        self.error = None
+        self.start_step = model.global_step
+        self.start_time = self.end_time = time.perf_counter()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, days=None):
+        # runs `days` more days in the worker, or until stop() if days is None
+        if self.running:
+            return
+        self.stop_requested.clear()
+        self.error = None
+        self.target_step = None if days is None else self.model.global_step + days
+        self.start_step = self.model.global_step
+        self.start_time, self.end_time = time.perf_counter(), None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while self.model.running and not self.stop_requested.is_set() and (self.target_step is None or self.model.global_step < self.target_step):
+                with self.lock:
+                    self.model.step()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.end_time = time.perf_counter()
+
+    def stop(self, wait=True):
+        self.stop_requested.set()
+        if wait and self.thread is not None:
+            self.thread.join()
+
+    def step(self):
+        # one day, from the calling thread
+        with self.lock:
+            self.model.step()
+
+    def days_per_second(self):
+        # speed of the current (or last) run of the worker
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        return (self.model.global_step - self.start_step) / max(end_time - self.start_time, 1e-9)
@@ -0,0 +1,238 @@
+# benchmark.py
+#
+# Times JournalModel.step at a given population size, e.g.:
+#   python benchmark.py --num-authors 135972 --days 60
+# optionally reporting the memory used per researcher and per paper every simulated year:
+#   python benchmark.py --num-authors 135972 --days 1825 --memory
+# or compares the review-time samplers with the linear scan they replaced (coin_toss):
+#   python benchmark.py --sampling 1000000
+# or times the start of the web application and the creation of a model (as on reset):
+#   python benchmark.py --startup 5
+# or times the journals engine with 0 (in the model's process), 1, 2 and 4 worker processes, with the
+# size and pickling time of the papers and reviews exchanged with the workers every day:
+#   python benchmark.py --journals 0.25:0.73:1,0.25:0.73:1,0.25:0.5:2,0.25:0.5:2 --processes 0 1 2 4 --warmup 60
+
+import argparse
+import os
+import pickle
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.reduction import ForkingPickler
+import numpy as np
+from model import REVIEW_TIME
+from vectorized import VectorizedJournalModel
+from journals import MultiJournalModel, parse_journals
+from sampling import DiscreteSampler
+from run import ENGINES
+
+
+def coin_toss(generator, distribution):
+    # the review-time draw JournalModel used before DiscreteSampler, kept as the reference of benchmark_sampling
+    n = generator.random()
+    for k, v in sorted(distribution.items()):
+        if v >= n:
+            return k
+    return max(distribution.keys())
+
+
+def benchmark_sampling(n):
+    generator = random.Random(0)
+    review_time = REVIEW_TIME["L"]
+    sampler = DiscreteSampler(review_time, jitter=10)
+    rng = np.random.default_rng(0)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        coin_toss(generator, review_time) + generator.randint(0, 10)
+    coin_toss_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        sampler.sample(generator)
+    sample_time = time.perf_counter() - start
+    start = time.perf_counter()
+    sampler.sample_many(n, rng)
+    sample_many_time = time.perf_counter() - start
+
+    print(f"review time draws: {n}")
+    print(f"coin_toss + randint: {coin_toss_time / n * 1e9:.0f} ns/draw")
+    print(f"DiscreteSampler.sample: {sample_time / n * 1e9:.0f} ns/draw ({coin_toss_time / sample_time:.1f}x)")
+    print(f"DiscreteSampler.sample_many: {sample_many_time / n * 1e9:.1f} ns/draw ({coin_toss_time / sample_many_time:.0f}x)")
+
+
+def benchmark_startup(repeats, num_authors, distribution):
+    # median times over `repeats` runs
+    for engine, cls in ENGINES.items():
+        build_times, deferred_times, first_step_times = [], [], []
+        for seed in range(repeats):
+            models = []  # closed at once, as the journals engine keeps worker processes and shared memory
+            try:
+                start = time.perf_counter()
+                models.append(cls(num_authors=num_authors, max_yearly_reviews_per_author_distribution=distribution, output_format="none", seed=seed))
+                build_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                models.append(cls(num_authors=num_authors, max_yearly_reviews_per_author_distribution=distribution, output_format="none", seed=seed,
+                                  defer_population=True))
+                deferred_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                models[-1].step()
+                first_step_times.append(time.perf_counter() - start)
+            finally:
+                for model in models:
+                    model.close()
+        print(f"{engine}: model creation {statistics.median(build_times) * 1000:.0f} ms; "
+              f"with deferred population {statistics.median(deferred_times) * 1000:.1f} ms, "
+              f"then first step {statistics.median(first_step_times) * 1000:.0f} ms")
+
+    # the web application is imported in a fresh interpreter, in a temporary directory for its output files
+    app_times = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", "import app"], cwd=output_dir, capture_output=True, text=True,
+                                    env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))))
+            if result.returncode != 0:
+                print(f"app startup: import failed ({result.stderr.strip().splitlines()[-1]})")
+                return
+            app_times.append(time.perf_counter() - start)
+    print(f"app startup (import of app.py in a new interpreter): {statistics.median(app_times):.2f} s")
+
+
+def benchmark_journals(spec, processes, days, warmup, **params):
+    # step times by number of worker processes; the messages of every day are also pickled and unpickled
+    # once more (as the pipes do on both sides), and that time is measured and left out of the step times
+    journals = parse_journals(spec)
+    print(f"{len(journals)} journals, {os.cpu_count()} cores")
+    reference = None
+    for n in processes:
+        model = MultiJournalModel(journals=journals, processes=n, output_format="none", horizon=warmup + days, **params)
+        try:
+            model.build_population()
+            for _ in range(warmup):
+                model.step()
+            run_journals = model.run_journals
+            transfer = {"bytes": 0, "seconds": 0.0}
+
+            def measured_run_journals(method, work):
+                results = run_journals(method, work)
+                start = time.perf_counter()
+                for payload in (work, results):
+                    data = ForkingPickler.dumps(payload)
+                    pickle.loads(data)
+                    transfer["bytes"] += len(data)
+                transfer["seconds"] += time.perf_counter() - start
+                return results
+
+            model.run_journals = measured_run_journals
+            start = time.perf_counter()
+            for _ in range(days):
+                model.step()
+            step_time = (time.perf_counter() - start - transfer["seconds"]) / days
+        finally:
+            model.close()
+        reference = reference or step_time
+        print(f"processes {n}: mean step {step_time * 1000:.1f} ms ({reference / step_time:.2f}x the first); "
+              f"messages {transfer['bytes'] / days / 1024:.0f} KiB/day, "
+              f"pickling and unpickling them {transfer['seconds'] / days * 1000:.1f} ms/day")
+
+
+def object_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def records_size(records):
+    # size of a list of tuples, including the ints they hold (small ints are shared by the interpreter)
+    size = sys.getsizeof(records)
+    for record in records:
+        size += sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record if isinstance(v, int) and not -5 <= v <= 256)
+    return size
+
+
+def memory_report(model):
+    # bytes per researcher (state and review assignments) and per live paper (generated and not yet reviewed)
+    papers = list(model.submitted_papers_dict.values())
+    if isinstance(model, VectorizedJournalModel):
+        num_researchers = model.num_researchers
+        researchers_size = sum(v.nbytes for v in vars(model).values() if isinstance(v, np.ndarray))
+        researchers_size += sys.getsizeof(model.papers_to_submit) + sum(sys.getsizeof(p) for p in model.papers_to_submit.values())
+        for pending in model.papers_to_submit.values():
+            papers += pending
+    else:
+        num_researchers = len(model.researchers)
+        researchers_size = sys.getsizeof(model.researchers)
+        for researcher in model.researchers.values():
+            researchers_size += object_size(researcher) + sys.getsizeof(researcher.papers_to_submit) + records_size(researcher.papers_to_review)
+            papers += researcher.papers_to_submit
+    papers_size = sum(object_size(paper) + records_size(paper.reviewers) for paper in papers)
+    print(f"step {model.global_step}: {num_researchers} researchers, {researchers_size / num_researchers:.0f} B/researcher; "
+          f"{len(papers)} papers, {papers_size / max(len(papers), 1):.0f} B/paper; "
+          f"{(researchers_size + papers_size) / 2**20:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the steps of the peer-review simulation")
+    parser.add_argument("--engine", choices=ENGINES.keys(), default="agents")
+    parser.add_argument("--num-authors", type=int, default=135972)
+    parser.add_argument("--days", type=int, default=30, help="number of timed steps")
+    parser.add_argument("--warmup", type=int, default=0, help="number of untimed steps before the timed ones")
+    parser.add_argument("--num-days-with-no-tokens-needed", type=int, default=365)
+    parser.add_argument("--max-yearly-reviews-per-author-distribution", choices=["Yes", "No"], default="Yes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulation, fixed so that runs of different versions are comparable")
+    parser.add_argument("--memory", action="store_true", help="report the memory per researcher and per paper every 365 steps")
+    parser.add_argument("--sampling", type=int, metavar="N", help="benchmark N review time draws instead of the simulation")
+    parser.add_argument("--startup", type=int, metavar="N", help="time the creation of models and the start of the web application N times")
+    parser.add_argument("--journals", metavar="SPEC", help="time the journals engine with these journals (see parse_journals) instead")
+    parser.add_argument("--processes", type=int, nargs="+", default=[0, 1, 2, 4], help="numbers of worker processes timed with --journals")
+    args = parser.parse_args()
+
+    if args.sampling:
+        benchmark_sampling(args.sampling)
+        return
+    if args.startup:
+        benchmark_startup(args.startup, args.num_authors, args.max_yearly_reviews_per_author_distribution)
+        return
+    if args.journals:
+        benchmark_journals(args.journals, args.processes, args.days, args.warmup, num_authors=args.num_authors, seed=args.seed,
+                           num_days_with_no_tokens_needed=args.num_days_with_no_tokens_needed,
+                           max_yearly_reviews_per_author_distribution=args.max_yearly_reviews_per_author_distribution)
+        return
+
+    start = time.perf_counter()
+    model = ENGINES[args.engine](
+        num_authors=args.num_authors,
+        num_days_with_no_tokens_needed=args.num_days_with_no_tokens_needed,
+        max_yearly_reviews_per_author_distribution=args.max_yearly_reviews_per_author_distribution,
+        output_format="none",
+        horizon=args.warmup + args.days,
+        seed=args.seed,
+    )
+    build_time = time.perf_counter() - start
+    step_times = []
+    try:
+        for _ in range(args.warmup):
+            model.step()
+        for day in range(1, args.days + 1):
+            start = time.perf_counter()
+            model.step()
+            step_times.append(time.perf_counter() - start)
+            if args.memory and (day % 365 == 0 or day == args.days):
+                memory_report(model)
+    finally:
+        model.close()
+
+    print(f"engine: {args.engine}, researchers: {args.num_authors}, build: {build_time:.2f} s")
+    print(f"steps {args.warmup + 1}-{args.warmup + args.days}: "
+          f"mean {statistics.mean(step_times) * 1000:.1f} ms, "
+          f"median {statistics.median(step_times) * 1000:.1f} ms, "
+          f"last {step_times[-1] * 1000:.1f} ms, "
+          f"{len(step_times) / sum(step_times):.2f} steps/s")
+
+
+if __name__ == "__main__":
+    main()
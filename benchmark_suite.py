@@ -0,0 +1,146 @@
+# benchmark_suite.py
+#
+# Reproducible performance suite: times JournalModel.step and whole runs for every engine, population
+# size and max_yearly_reviews_per_author_distribution, before and after tokens are needed, e.g.:
+#   python benchmark_suite.py --output bench-$(git rev-parse --short HEAD).jsonl
+# Results are appended as JSON lines, one per configuration and phase; two result files (e.g. of two
+# commits) are compared with:
+#   python benchmark_suite.py --compare bench-old.jsonl bench-new.jsonl
+# Every configuration runs in a new process with a fixed seed, so that peak memory is measured per
+# configuration and runs are repeatable; nothing is downloaded or written besides the results.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from run import ENGINES, peak_rss_mib
+
+SIZES = (1000, 10000, 135972, 500000)
+DISTRIBUTIONS = ("Yes", "No")
+PHASES = ("no tokens", "tokens")  # before and after num_days_with_no_tokens_needed
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_configuration(engine, num_authors, distribution, days, seed):
+    # runs in its own process: `days` days without tokens, then `days` days with tokens; one result per phase
+    start = time.perf_counter()
+    model = ENGINES[engine](num_authors=num_authors, max_yearly_reviews_per_author_distribution=distribution,
+                            num_days_with_no_tokens_needed=days, output_format="none", horizon=2 * days, seed=seed)
+    results = []
+    try:
+        model.build_population()
+        build_time = time.perf_counter() - start
+        for phase in PHASES:
+            step_times = []
+            for _ in range(days):
+                start = time.perf_counter()
+                model.step()
+                step_times.append(time.perf_counter() - start)
+            submitted, waiting_reviewers, in_review = model.queue_sizes()
+            results.append({
+                "engine": engine,
+                "num_authors": num_authors,
+                "num_researchers": getattr(model, "num_researchers", None) or len(model.researchers),  # "Yes" builds at least 135957,
+                "distribution": distribution,
+                "phase": phase,
+                "first_step": model.global_step - days + 1,
+                "days": days,
+                "seed": seed,
+                "build_s": build_time,
+                "run_s": sum(step_times),
+                "steps_per_s": days / sum(step_times),
+                "mean_step_ms": statistics.mean(step_times) * 1000,
+                "median_step_ms": statistics.median(step_times) * 1000,
+                "max_step_ms": max(step_times) * 1000,
+                "peak_rss_mib": peak_rss_mib(),
+                "submitted": submitted,
+                "waiting_reviewers": waiting_reviewers,
+                "in_review": in_review,
+            })
+    finally:
+        model.close()
+    return results
+
+
+def suite(output, engines, sizes, distributions, days, seed):
+    commit = git_commit()
+    machine = {"python": platform.python_version(), "machine": platform.machine(), "processor": platform.processor() or None,
+               "cpus": os.cpu_count()}
+    # one configuration at a time, each in a new process
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1)
+    with executor, open(output, "a") as f:
+        for engine in engines:
+            for num_authors in sizes:
+                for distribution in distributions:
+                    start = time.perf_counter()
+                    results = executor.submit(run_configuration, engine, num_authors, distribution, days, seed).result()
+                    wall_time = time.perf_counter() - start
+                    for result in results:
+                        result.update(commit=commit, wall_s=wall_time, **machine)
+                        f.write(json.dumps(result) + "\n")
+                        print(f"{engine:10} {num_authors:>7} {distribution:3} {result['phase']:9}: "
+                              f"{result['steps_per_s']:8.2f} steps/s, median {result['median_step_ms']:8.1f} ms, "
+                              f"peak RSS {result['peak_rss_mib']:6.0f} MiB, queue {result['submitted']}")
+                    f.flush()
+
+
+def configuration_key(result):
+    return result["engine"], result["num_authors"], result["distribution"], result["phase"], result["days"], result["seed"]
+
+
+def read_results(path):
+    with open(path) as f:
+        return {configuration_key(result): result for result in map(json.loads, f) if result}
+
+
+def compare(old_path, new_path, threshold):
+    # speed and memory of the configurations in both files; returns the number of regressions
+    old, new = read_results(old_path), read_results(new_path)
+    regressions = 0
+    for key in sorted(old.keys() & new.keys(), key=str):
+        speedup = new[key]["steps_per_s"] / old[key]["steps_per_s"]
+        memory = new[key]["peak_rss_mib"] / old[key]["peak_rss_mib"]
+        same_queue = new[key]["submitted"] == old[key]["submitted"]
+        flag = ""
+        if speedup < 1 - threshold:
+            flag = "  SLOWER"
+            regressions += 1
+        engine, num_authors, distribution, phase, days, seed = key
+        print(f"{engine:10} {num_authors:>7} {distribution:3} {phase:9}: {old[key]['steps_per_s']:8.2f} -> {new[key]['steps_per_s']:8.2f} steps/s "
+              f"({speedup:.2f}x), memory {memory:.2f}x{'' if same_queue else ', different trajectory'}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the performance suite of the peer-review simulation, or compare two results files")
+    parser.add_argument("--output", default="benchmark-results.jsonl", help="file the results are appended to (JSON lines)")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES.keys(), default=list(ENGINES.keys()))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES), help="numbers of researchers")
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS),
+                        help="values of max_yearly_reviews_per_author_distribution")
+    parser.add_argument("--days", type=int, default=30, help="timed days in each phase (tokens are needed after the first phase)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files instead of running the suite")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        raise SystemExit(1 if regressions else 0)
+    suite(args.output, args.engines, args.sizes, args.distributions, args.days, args.seed)
+
+
+if __name__ == "__main__":
+    main()
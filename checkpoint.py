@@ -0,0 +1,114 @@
+# checkpoint.py
+#
+# Snapshots of a running simulation, e.g. taken at the end of the warm-up period and restored in
+# many runs with different parameters:
+#   model.save_checkpoint("warmup-365")
+#   JournalModel(checkpoint="warmup-365", initial_tokens=2, prob_accept_L=0.3)
+# (parameters not given take the defaults of JournalModel; run.py and sweep.py default to the checkpoint's;
+# only those in model.RESTORE_OVERRIDES and initial_tokens may differ from the checkpoint's).
+# A checkpoint is a directory with one .npy file per array (researchers' state, papers, reviews)
+# and a state.json file with the parameters, counters, moving-average windows and random states.
+
+import json
+import os
+import numpy as np
+from agents import Paper
+
+STATE_FILE = "state.json"
+
+
+def write_checkpoint(path, arrays, state):
+    # every file is replaced rather than overwritten, as it may be memory-mapped by the restored run saving it
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        temporary = os.path.join(path, f"{name}.tmp.npy")
+        np.save(temporary, array)
+        os.replace(temporary, os.path.join(path, f"{name}.npy"))
+    with open(os.path.join(path, STATE_FILE), "w") as f:
+        json.dump(state, f)
+
+
+def read_checkpoint(path, mmap=True):
+    # arrays are memory-mapped copy-on-write, so only the pages actually read are loaded, and the
+    # engines keeping the researchers' state in arrays use them as they are (changes are not saved)
+    with open(os.path.join(path, STATE_FILE)) as f:
+        state = json.load(f)
+    arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode="c" if mmap else None)
+              for name in os.listdir(path) if name.endswith(".npy") and not name.endswith(".tmp.npy")}
+    return arrays, state
+
+
+def papers_to_arrays(papers):
+    # one row per paper, and one row per reviewer of each paper in the paper_reviewer_* arrays
+    return {
+        "paper_id": np.array([p.ID for p in papers], dtype=np.int64),
+        "paper_generation_step": np.array([p.generation_step for p in papers], dtype=np.int64),
+        "paper_submission_step": np.array([-1 if p.submission_step is None else p.submission_step for p in papers], dtype=np.int64),
+        "paper_submitted": np.array([p.submission_step is not None for p in papers], dtype=bool),  # steps are negative in warm starts
+        "paper_author": np.array([p.author_id for p in papers], dtype=np.int64),
+        "paper_num_reviews": np.array([p.num_reviews for p in papers], dtype=np.int64),
+        "paper_num_invites": np.array([p.num_invites for p in papers], dtype=np.int64),
+        "paper_num_reviews_done": np.array([p.num_reviews_done for p in papers], dtype=np.int64),
+        "paper_num_reviewers": np.array([len(p.reviewers) for p in papers], dtype=np.int64),
+        "paper_reviewer": np.array([rid for p in papers for rid, done in p.reviewers], dtype=np.int64),
+        "paper_reviewer_done": np.array([done for p in papers for rid, done in p.reviewers], dtype=np.int64),
+    }
+
+
+def arrays_to_papers(arrays):
+    papers = []
+    reviewers = list(zip(arrays["paper_reviewer"].tolist(), arrays["paper_reviewer_done"].tolist()))
+    # checkpoints without paper_submitted mark the papers not submitted yet with a submission step of -1
+    submitted = (arrays["paper_submitted"] if "paper_submitted" in arrays else arrays["paper_submission_step"] != -1).tolist()
+    start = 0
+    for i, (ID, generation_step, submission_step, author_id, num_reviews, num_invites, num_reviews_done, num_reviewers) in enumerate(zip(
+            *(arrays[name].tolist() for name in ("paper_id", "paper_generation_step", "paper_submission_step", "paper_author",
+                                                 "paper_num_reviews", "paper_num_invites", "paper_num_reviews_done", "paper_num_reviewers")))):
+        paper = Paper(ID, generation_step, submission_step if submitted[i] else None, author_id, num_reviews)
+        paper.num_invites = num_invites
+        paper.num_reviews_done = num_reviews_done
+        paper.reviewers = reviewers[start:start + num_reviewers]
+        start += num_reviewers
+        papers.append(paper)
+    return papers
+
+
+def steps_to_arrays(name, ids_per_step):
+    # {step: ids} as two aligned arrays, in the order of the steps and of the ids
+    steps = [step for step, ids in ids_per_step.items() for _ in ids]
+    ids = [rid for rid_list in ids_per_step.values() for rid in rid_list]
+    return {f"{name}_step": np.array(steps, dtype=np.int64), f"{name}_id": np.array(ids, dtype=np.int64)}
+
+
+def arrays_to_steps(name, arrays, as_lists=True):
+    # {step: ids}, the ids as lists or as views of the array
+    steps, ids = arrays[f"{name}_step"], np.asarray(arrays[f"{name}_id"])
+    if len(steps) == 0:
+        return dict()
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(steps)) + 1))  # the ids of a step are contiguous
+    return {step: group.tolist() if as_lists else group for step, group in zip(steps[starts].tolist(), np.split(ids, starts[1:]))}
+
+
+def random_state(generator):
+    # state of a random.Random, as JSON
+    version, internal, gauss_next = generator.getstate()
+    return [version, list(internal), gauss_next]
+
+
+def set_random_state(generator, state):
+    version, internal, gauss_next = state
+    generator.setstate((version, tuple(internal), gauss_next))
+
+
+def window_state(window):
+    return {"counts": list(window.counts), "totals": list(window.totals), "step": window.step,
+            "sum_counts": [window.sum_counts[days] for days in window.windows],
+            "sum_totals": [window.sum_totals[days] for days in window.windows]}
+
+
+def set_window_state(window, state):
+    window.counts = list(state["counts"])
+    window.totals = list(state["totals"])
+    window.step = state["step"]
+    window.sum_counts = dict(zip(window.windows, state["sum_counts"]))
+    window.sum_totals = dict(zip(window.windows, state["sum_totals"]))
@@ -0,0 +1,280 @@
+# cohort.py
+
+import numpy as np
+from vectorized import VectorizedJournalModel
+from agents import LAZY
+from indexed import IndexedSet, CountTree
+
+
+class CohortJournalModel(VectorizedJournalModel):
+    """JournalModel engine keeping idle researchers as counted cohorts, for populations of millions.
+
+    A researcher is idle when Lazy with no papers to submit and no reviews to do. Idle researchers
+    with the same tokens, maximum number of yearly reviews and number of reviews accepted in the
+    last 365 days are interchangeable, so they are only counted, in cohorts keyed by these three
+    values. The other researchers are materialized in the arrays of VectorizedJournalModel, indexed
+    by slot: a cohort member is materialized when it writes a paper or accepts an invitation, and
+    returns to its cohort once idle again, freeing its slot for another one. Memory and time per
+    step grow with the number of busy researchers rather than with the population.
+
+    The yearly reviews of cohort members still expire one by one: an idle member with a maximum
+    number of yearly reviews and reviews accepted in the last 365 days keeps their expiry days in
+    a record of its cohort, moves to the cohort with one yearly review less on each of them, and
+    takes them back when materialized (as a uniform pick among the records of the cohort); only
+    the members with no reviews to expire are bare counts. Uniform invitations pick among the
+    whole population (num_researchers, which is num_authors unless the maximum yearly reviews
+    distribution has more researchers), and the yearly number of papers per researcher is not
+    tracked. validate.py compares the metrics with the other engines.
+    """
+
+    SLOT_ARRAYS = VectorizedJournalModel.RESEARCHER_ARRAYS + ("max_yearly_reviews", "slot_version")
+
+    def init_researchers(self):
+        max_yearly_reviews = self.researchers_max_yearly_reviews()
+        self.num_researchers = len(max_yearly_reviews)
+        self.papers_to_submit = dict()  # maps slot to the papers waiting for tokens
+        self.rev_paper = np.zeros(0, dtype=np.int64)
+        self.rev_reviewer = np.zeros(0, dtype=np.int64)
+        self.rev_scheduled = np.zeros(0, dtype=np.int64)
+        self.rev_accepted = np.zeros(0, dtype=np.int64)
+
+        # Materialized researchers, in slots of the arrays; slot_version counts the researchers a slot held
+        for name in self.SLOT_ARRAYS:
+            setattr(self, name, np.zeros(0, dtype=np.int8 if name in ("status", "prev_status") else np.int64))
+        self.free_slots = []  # stack, lowest slot on top
+        self.resize_slots(1024)
+        self.materialized = IndexedSet()
+        self.slot_expiries = dict()  # maps slot to the days its yearly reviews expire, if its yearly reviews are limited
+        self.expiry_calendar = dict()  # maps day to the (slot, slot_version) losing a yearly review that day
+
+        # Cohorts of idle researchers
+        self.cohorts = dict()  # maps (tokens, max yearly reviews, yearly reviews) to the cohort index
+        self.cohort_keys = []
+        self.cohort_sizes = CountTree()
+        self.idle_records = dict()  # maps record id to the cohort of an idle member and the sorted expiry days of their yearly reviews
+        self.cohort_members = dict()  # maps cohort index to the IndexedSet of the records of its members, if they have reviews to expire
+        self.record_calendar = dict()  # maps day to the records whose first expiry day it is
+        self.next_record = 0
+        caps, counts = np.unique(max_yearly_reviews, return_counts=True)
+        for cap, count in zip(caps.tolist(), counts.tolist()):
+            self.cohort_sizes.add(self.cohort(self.initial_tokens, cap, 0), count)
+
+    def resize_slots(self, capacity):
+        old_capacity = len(self.num_tokens)
+        for name in self.SLOT_ARRAYS:
+            values = getattr(self, name)
+            resized = np.zeros(capacity, dtype=values.dtype)
+            resized[:old_capacity] = values
+            setattr(self, name, resized)
+        self.free_slots.extend(range(capacity - 1, old_capacity - 1, -1))
+
+    def cohort(self, tokens, cap, yearly_reviews):
+        key = (tokens, cap, yearly_reviews)
+        index = self.cohorts.get(key)
+        if index is None:
+            index = self.cohorts[key] = len(self.cohort_keys)
+            self.cohort_keys.append(key)
+        return index
+
+    def materialize(self, cohort):
+        # a member of the cohort leaves it for a slot, which is returned
+        tokens, cap, yearly_reviews = self.cohort_keys[cohort]
+        self.cohort_sizes.add(cohort, -1)
+        if not self.free_slots:
+            self.resize_slots(2 * len(self.num_tokens))
+        slot = self.free_slots.pop()
+        self.materialized.add(slot)
+        self.num_tokens[slot] = tokens
+        self.max_yearly_reviews[slot] = cap
+        if yearly_reviews:
+            # a uniform member of the cohort, with the expiry days of their record
+            members = self.cohort_members[cohort]
+            record = members[int(self.random_generation.random() * len(members))]
+            members.remove(record)
+            expiries = self.idle_records.pop(record)[1]
+            self.slot_expiries[slot] = expiries
+            version = int(self.slot_version[slot])
+            for day in expiries:
+                self.expiry_calendar.setdefault(day, []).append((slot, version))
+            self.yearly_reviews[slot] = len(expiries)
+        return slot
+
+    def release(self, slot):
+        # an idle researcher returns to its cohort, with a record of their expiry days if any
+        tokens, cap = int(self.num_tokens[slot]), int(self.max_yearly_reviews[slot])
+        expiries = self.slot_expiries.pop(slot, [])
+        cohort = self.cohort(tokens, cap, len(expiries))
+        if expiries:
+            self.add_record(cohort, expiries)
+        self.cohort_sizes.add(cohort, 1)
+        version = self.slot_version[slot] + 1
+        for name in self.SLOT_ARRAYS:
+            getattr(self, name)[slot] = 0
+        self.slot_version[slot] = version
+        self.materialized.remove(slot)
+        self.free_slots.append(slot)
+
+    def add_record(self, cohort, expiries):
+        record = self.next_record
+        self.next_record += 1
+        self.idle_records[record] = (cohort, expiries)
+        self.cohort_members.setdefault(cohort, IndexedSet()).add(record)
+        self.record_calendar.setdefault(expiries[0], []).append(record)
+
+    def release_idle(self):
+        slots = np.array(self.materialized.items, dtype=np.int64)
+        idle = (self.status[slots] == LAZY) & (self.num_papers_to_submit[slots] == 0) & (self.num_papers_to_review[slots] == 0)
+        for slot in slots[idle].tolist():
+            self.release(slot)
+
+    def expire_yearly_counts(self, step):
+        # the counters of the reviews accepted and papers generated are only kept for the metrics of the day
+        self.reviews_accepted_per_step.pop(step, None)
+        self.papers_generated_per_step.pop(step, None)
+        today = step + 366
+        for slot, version in self.expiry_calendar.pop(today, ()):
+            if self.slot_version[slot] == version:
+                self.yearly_reviews[slot] -= 1
+                self.slot_expiries[slot].pop(0)
+        # members of the cohorts move to the cohort with their yearly reviews left (records of materialized
+        # members are gone)
+        for record in self.record_calendar.pop(today, ()):
+            if record not in self.idle_records:
+                continue
+            cohort, expiries = self.idle_records.pop(record)
+            self.cohort_members[cohort].remove(record)
+            while expiries and expiries[0] <= today:
+                expiries.pop(0)
+            tokens, cap, yearly_reviews = self.cohort_keys[cohort]
+            lower = self.cohort(tokens, cap, len(expiries))
+            self.cohort_sizes.add(cohort, -1)
+            self.cohort_sizes.add(lower, 1)
+            if expiries:
+                self.add_record(lower, expiries)
+
+    def researchers_actions(self):
+        self.release_idle()
+        super().researchers_actions()
+
+    def generate_papers(self):
+        # each materialized researcher may write a paper, and so may a binomial number of the members of each cohort
+        slots = np.array(self.materialized.items, dtype=np.int64)
+        authors = slots[self.rng_generation.random(len(slots)) < self.daily_submission_prob]
+        writers = self.rng_generation.binomial(np.array(self.cohort_sizes.counts), self.daily_submission_prob)
+        new_authors = [self.materialize(cohort) for cohort in np.repeat(np.arange(len(writers)), writers).tolist()]
+        self.write_papers(np.concatenate([authors, np.array(new_authors, dtype=np.int64)]))
+
+    def pick_researcher(self, draw):
+        # materialized researchers come first, then the cohort members; a cohort member is
+        # returned as -1 - its cohort index, and materialized only if it accepts the invitation
+        position = int(draw * self.num_researchers)
+        if position < len(self.materialized):
+            return self.materialized[position]
+        return -1 - self.cohort_sizes.find(position - len(self.materialized))
+
+    def accepts_invitation(self, paper, reviewer, accept):
+        if reviewer >= 0:
+            return super().accepts_invitation(paper, reviewer, accept)
+        tokens, cap, yearly_reviews = self.cohort_keys[-1 - reviewer]
+        return (cap == 0 or yearly_reviews < cap) and accept <= self.prob_accept_review_invitation[LAZY]
+
+    def add_reviewer(self, paper, reviewer, eager_researchers):
+        if reviewer < 0:
+            reviewer = self.materialize(-1 - reviewer)
+        super().add_reviewer(paper, reviewer, eager_researchers)
+        if self.max_yearly_reviews[reviewer] > 0:
+            day = self.global_step + 366
+            self.slot_expiries.setdefault(reviewer, []).append(day)
+            self.expiry_calendar.setdefault(day, []).append((reviewer, int(self.slot_version[reviewer])))
+
+    def warm_start_researchers(self, arrays):
+        # the reviewers with reviews to do are materialized, the others join the cohort of their yearly reviews
+        caps = self.researchers_max_yearly_reviews()
+        busy = np.unique(arrays["review_reviewer"])
+        slots = np.array([self.materialize(self.cohort(self.initial_tokens, cap, 0)) for cap in caps[busy].tolist()], dtype=np.int64)
+        self.rev_paper, self.rev_scheduled, self.rev_accepted = (np.array(arrays[f"review_{name}"], dtype=np.int64) for name in ("paper", "scheduled", "accepted"))
+        self.rev_reviewer = slots[np.searchsorted(busy, arrays["review_reviewer"])]
+        np.add.at(self.num_papers_to_review, self.rev_reviewer, 1)
+        # the reviewers of the papers are slots too, and those who are done are no one
+        pending = arrays["paper_reviewer_done"] == -1
+        paper_reviewer = np.full(len(pending), -1, dtype=np.int64)
+        paper_reviewer[pending] = slots[np.searchsorted(busy, arrays["paper_reviewer"][pending])]
+        arrays["paper_reviewer"] = paper_reviewer
+
+        # expiry days of the yearly reviews of each researcher, in order; they are not tracked without a maximum
+        ids, days = arrays["reviews_accepted_id"], arrays["reviews_accepted_step"] + 366
+        limited = caps[ids] > 0
+        order = np.lexsort((days[limited], ids[limited]))
+        ids, days = ids[limited][order], days[limited][order]
+        for rid, slot in zip(busy.tolist(), slots.tolist()):
+            expiries = days[np.searchsorted(ids, rid):np.searchsorted(ids, rid, side="right")].tolist()
+            if expiries:
+                self.slot_expiries[slot] = expiries
+                self.yearly_reviews[slot] = len(expiries)
+                for day in expiries:
+                    self.expiry_calendar.setdefault(day, []).append((slot, int(self.slot_version[slot])))
+
+        # the idle ones move to the cohort of their yearly reviews, with a record of their expiry days, as in release()
+        idle = ~np.isin(ids, busy)
+        ids, days = ids[idle], days[idle]
+        starts = np.flatnonzero(np.diff(ids, prepend=-1))
+        for rid, expiries in zip(ids[starts].tolist(), np.split(days, starts[1:])):
+            cap = int(caps[rid])
+            cohort = self.cohort(self.initial_tokens, cap, len(expiries))
+            self.add_record(cohort, expiries.tolist())
+            self.cohort_sizes.add(self.cohort(self.initial_tokens, cap, 0), -1)
+            self.cohort_sizes.add(cohort, 1)
+
+    def researchers_state(self):
+        arrays, pending_papers = super().researchers_state()
+        arrays.update({name: getattr(self, name) for name in self.SLOT_ARRAYS})
+        arrays["materialized"] = np.array(self.materialized.items, dtype=np.int64)  # in the order used to pick reviewers
+        arrays["free_slots"] = np.array(self.free_slots, dtype=np.int64)
+        for i, name in enumerate(("tokens", "cap", "yearly_reviews")):
+            arrays[f"cohort_{name}"] = np.array([key[i] for key in self.cohort_keys], dtype=np.int64)
+        arrays["cohort_size"] = np.array(self.cohort_sizes.counts[:len(self.cohort_keys)], dtype=np.int64)
+        arrays["cohort_initial_tokens"] = np.array([self.initial_tokens], dtype=np.int64)
+        # records of the idle members, in the order of the members of each cohort and of the calendar
+        records = sorted(self.idle_records)
+        arrays["record_id"] = np.array(records, dtype=np.int64)
+        arrays["record_cohort"] = np.array([self.idle_records[r][0] for r in records], dtype=np.int64)
+        arrays["record_expiry_record"] = np.repeat(arrays["record_id"], [len(self.idle_records[r][1]) for r in records])
+        arrays["record_expiry_day"] = np.array([day for r in records for day in self.idle_records[r][1]], dtype=np.int64)
+        cohorts = sorted(self.cohort_members)
+        arrays["member_cohort"] = np.repeat(np.array(cohorts, dtype=np.int64), [len(self.cohort_members[c]) for c in cohorts])
+        arrays["member_record"] = np.array([r for c in cohorts for r in self.cohort_members[c]], dtype=np.int64)
+        days = sorted(self.record_calendar)
+        calendar = [(day, r) for day in days for r in self.record_calendar[day] if r in self.idle_records]
+        arrays["record_calendar_day"] = np.array([day for day, r in calendar], dtype=np.int64)
+        arrays["record_calendar_record"] = np.array([r for day, r in calendar], dtype=np.int64)
+        arrays["next_record"] = np.array([self.next_record], dtype=np.int64)
+        slots = sorted(self.slot_expiries)
+        arrays["slot_expiry_slot"] = np.repeat(np.array(slots, dtype=np.int64), [len(self.slot_expiries[s]) for s in slots])
+        arrays["slot_expiry_day"] = np.array([day for s in slots for day in self.slot_expiries[s]], dtype=np.int64)
+        return arrays, pending_papers
+
+    def restore_researchers(self, arrays, pending_papers):
+        super().restore_researchers(arrays, pending_papers)
+        for name in ("max_yearly_reviews", "slot_version"):
+            setattr(self, name, np.asarray(arrays[name], dtype=np.int64))
+        self.materialized = IndexedSet(arrays["materialized"].tolist())
+        self.free_slots = arrays["free_slots"].tolist()
+        self.num_tokens[self.free_slots] = 0  # the tokens of the checkpoint may have been shifted to new initial tokens
+        tokens_shift = self.initial_tokens - int(arrays["cohort_initial_tokens"][0])
+        self.cohorts, self.cohort_keys, self.cohort_sizes = dict(), [], CountTree()
+        for tokens, cap, yearly_reviews, size in zip(*(arrays[f"cohort_{name}"].tolist() for name in ("tokens", "cap", "yearly_reviews", "size"))):
+            self.cohort_sizes.add(self.cohort(tokens + tokens_shift, cap, yearly_reviews), size)
+        self.idle_records = {r: (cohort, []) for r, cohort in zip(arrays["record_id"].tolist(), arrays["record_cohort"].tolist())}
+        for r, day in zip(arrays["record_expiry_record"].tolist(), arrays["record_expiry_day"].tolist()):
+            self.idle_records[r][1].append(day)
+        self.cohort_members = dict()
+        for cohort, r in zip(arrays["member_cohort"].tolist(), arrays["member_record"].tolist()):
+            self.cohort_members.setdefault(cohort, IndexedSet()).add(r)
+        self.record_calendar = dict()
+        for day, r in zip(arrays["record_calendar_day"].tolist(), arrays["record_calendar_record"].tolist()):
+            self.record_calendar.setdefault(day, []).append(r)
+        self.next_record = int(arrays["next_record"][0])
+        self.slot_expiries, self.expiry_calendar = dict(), dict()
+        for slot, day in zip(arrays["slot_expiry_slot"].tolist(), arrays["slot_expiry_day"].tolist()):
+            self.slot_expiries.setdefault(slot, []).append(day)
+            self.expiry_calendar.setdefault(day, []).append((slot, int(self.slot_version[slot])))
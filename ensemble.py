@@ -0,0 +1,163 @@
+# ensemble.py
+
+import os
+import numpy as np
+import pandas as pd
+
+
+class EnsembleStats:
+    """Mean, variance and approximate quantiles of the metrics of many runs, step by step, computed online.
+
+    The metrics of a run are added as they arrive (add(), one or more steps at a time); only the
+    running statistics are kept, so memory grows with the number of steps and `columns` but not
+    with the number of runs. Mean and variance are exact (Welford's algorithm); every quantile is
+    estimated by the P² algorithm (Jain and Chlamtac, 1985) with five markers per step and column,
+    and is exact up to 5 runs. Runs may cover different steps; the last values of a run that stopped
+    early can be carried forward to a later step (add_run(rows, until)), so that the statistics of
+    the later steps do not only describe the runs still going, and the runs carried at each step
+    are counted ("Runs stopped").
+    """
+
+    def __init__(self, columns, quantiles=(0.05, 0.5, 0.95), capacity=1024):
+        self.columns = list(columns)
+        self.quantiles = np.array(quantiles, dtype=np.float64)
+        # increments of the desired positions of the markers of each quantile (minimum, p/2, p, (1+p)/2, maximum)
+        p = self.quantiles[:, None]
+        self.increments = np.hstack([0 * p, p / 2, p, (1 + p) / 2, 0 * p + 1])
+        self.num_steps = 0
+        self.count = np.zeros(0, dtype=np.int64)
+        self.stopped = np.zeros(0, dtype=np.int64)  # runs whose values are carried forward, by step
+        self.mean = np.zeros((0, len(self.columns)))
+        self.m2 = np.zeros((0, len(self.columns)))
+        self.markers = np.zeros((0, len(self.columns), len(self.quantiles), 5))  # marker heights
+        self.positions = np.zeros((0, len(self.columns), len(self.quantiles), 5))  # marker positions, from 1
+        self.resize(capacity)
+
+    STATE = ("count", "stopped", "mean", "m2", "markers", "positions")
+
+    def resize(self, capacity):
+        for name in self.STATE:
+            values = getattr(self, name)
+            resized = np.zeros((capacity,) + values.shape[1:], dtype=values.dtype)
+            resized[:len(values)] = values
+            setattr(self, name, resized)
+
+    def add(self, steps, values, carried=False):
+        # values of one run at the given (distinct) steps, as a 2D array with one row per step; carried
+        # values are those of a run that stopped before these steps
+        steps = np.asarray(steps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape(len(steps), len(self.columns))
+        if len(steps) == 0:
+            return
+        if steps.max() >= len(self.count):
+            self.resize(max(int(steps.max()) + 1, 2 * len(self.count)))
+        self.num_steps = max(self.num_steps, int(steps.max()) + 1)
+
+        self.count[steps] += 1
+        if carried:
+            self.stopped[steps] += 1
+        count = self.count[steps]
+        delta = values - self.mean[steps]
+        self.mean[steps] += delta / count[:, None]
+        self.m2[steps] += delta * (values - self.mean[steps])
+
+        # the first 5 values are the initial markers, sorted once the fifth arrives
+        first = count <= 5
+        if first.any():
+            rows = steps[first]
+            self.markers[rows, :, :, count[first] - 1] = values[first][:, :, None]
+            full = rows[count[first] == 5]
+            self.markers[full] = np.sort(self.markers[full], axis=-1)
+            self.positions[full] = np.arange(1, 6)
+        if not first.all():
+            rows = steps[~first]
+            self.markers[rows], self.positions[rows] = p2_update(self.markers[rows], self.positions[rows], values[~first],
+                                                                 count[~first], self.increments)
+
+    def add_run(self, rows, until=None):
+        # the metrics of a run as recorded by its MetricsStore (a structured array), indexed by its "Step"
+        # field; if the run stopped before step `until`, its last values are carried forward to it
+        steps, values = rows["Step"], np.column_stack([rows[name] for name in self.columns])
+        self.add(steps, values)
+        if until is not None and len(steps) and steps[-1] < until:
+            carried = np.arange(steps[-1] + 1, until + 1)
+            self.add(carried, np.repeat(values[-1:], len(carried), axis=0), carried=True)
+
+    def std(self):
+        count = self.count[:self.num_steps, None]
+        return np.sqrt(np.divide(self.m2[:self.num_steps], count - 1, out=np.zeros_like(self.m2[:self.num_steps]), where=count > 1))
+
+    def quantile(self):
+        # (steps, columns, quantiles) array of the estimated quantiles; NaN for steps without runs
+        count = self.count[:self.num_steps]
+        estimates = self.markers[:self.num_steps, :, :, 2].copy()
+        estimates[count == 0] = np.nan
+        for c in range(1, 6):
+            rows = np.flatnonzero(count == c)
+            if len(rows):
+                values = self.markers[rows][:, :, 0, :c]  # the values seen so far, the same for every quantile
+                estimates[rows] = np.moveaxis(np.quantile(values, self.quantiles, axis=-1), 0, -1)
+        return estimates
+
+    def to_dataframe(self):
+        # one row per step with the number of runs (and of those carried forward), and the mean, standard deviation and quantiles of every column
+        data = {"Step": np.arange(self.num_steps), "Runs": self.count[:self.num_steps], "Runs stopped": self.stopped[:self.num_steps]}
+        mean, std, quantile = self.mean[:self.num_steps], self.std(), self.quantile()
+        for i, name in enumerate(self.columns):
+            data[f"{name} mean"] = np.where(data["Runs"] > 0, mean[:, i], np.nan)
+            data[f"{name} std"] = std[:, i]
+            for j, p in enumerate(self.quantiles):
+                data[f"{name} {p:.0%}"] = quantile[:, i, j]
+        return pd.DataFrame(data)
+
+    def save(self, path, **extra):
+        # writes the statistics (and the `extra` arrays) to an .npz file, atomically
+        arrays = {name: getattr(self, name)[:self.num_steps] for name in self.STATE}
+        arrays.update(extra, columns=np.array(self.columns), quantiles=self.quantiles)
+        temporary = path + ".tmp.npz"
+        np.savez(temporary, **arrays)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        # returns the statistics saved by save(), and the extra arrays
+        with np.load(path) as arrays:
+            stats = cls(arrays["columns"].tolist(), arrays["quantiles"], capacity=max(len(arrays["count"]), 1))
+            for name in cls.STATE:
+                if name in arrays:  # files saved before runs were carried forward have no "stopped"
+                    getattr(stats, name)[:len(arrays[name])] = arrays[name]
+            stats.num_steps = len(arrays["count"])
+            extra = {name: arrays[name] for name in arrays.files if name not in cls.STATE + ("columns", "quantiles")}
+        return stats, extra
+
+
+def p2_update(markers, positions, values, count, increments):
+    # one P² step for every (step, column, quantile) at once: markers and positions have shape
+    # (steps, columns, quantiles, 5), values (steps, columns), count (steps,) includes the new values
+    shape = markers.shape
+    q = markers.reshape(-1, 5).copy()
+    n = positions.reshape(-1, 5).copy()
+    x = np.broadcast_to(values[:, :, None], shape[:3]).reshape(-1)
+    desired = 1 + (np.broadcast_to(count[:, None, None], shape[:3]).reshape(-1, 1) - 1) * np.broadcast_to(increments, shape).reshape(-1, 5)
+
+    cell = (x[:, None] >= q[:, 1:4]).sum(axis=1)  # q[cell] <= x < q[cell + 1], after extending the extremes
+    q[:, 0] = np.minimum(q[:, 0], x)
+    q[:, 4] = np.maximum(q[:, 4], x)
+    n += np.arange(5) > cell[:, None]
+
+    for i in (1, 2, 3):
+        d = desired[:, i] - n[:, i]
+        move = np.flatnonzero(((d >= 1) & (n[:, i + 1] - n[:, i] > 1)) | ((d <= -1) & (n[:, i - 1] - n[:, i] < -1)))
+        if len(move) == 0:
+            continue
+        s = np.sign(d[move])
+        qm, nm = q[move], n[move]
+        parabolic = qm[:, i] + s / (nm[:, i + 1] - nm[:, i - 1]) * (
+            (nm[:, i] - nm[:, i - 1] + s) * (qm[:, i + 1] - qm[:, i]) / (nm[:, i + 1] - nm[:, i])
+            + (nm[:, i + 1] - nm[:, i] - s) * (qm[:, i] - qm[:, i - 1]) / (nm[:, i] - nm[:, i - 1]))
+        neighbour = i + s.astype(np.int64)
+        rows = np.arange(len(move))
+        linear = qm[:, i] + s * (qm[rows, neighbour] - qm[:, i]) / (nm[rows, neighbour] - nm[:, i])
+        q[move, i] = np.where((qm[:, i - 1] < parabolic) & (parabolic < qm[:, i + 1]), parabolic, linear)
+        n[move, i] += s
+    return q.reshape(shape), n.reshape(shape)
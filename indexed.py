@@ -0,0 +1,93 @@
+# indexed.py
+
+class IndexedSet:
+    """Set supporting O(1) add, remove, membership test and access by position.
+
+    Items are kept in a list together with a dict mapping each item to its position; removing an
+    item moves the last one into its slot (swap-remove), so the order of the items is arbitrary.
+    Picking the item at a random position gives a uniform sample of the set.
+    """
+
+    def __init__(self, items=()):
+        self.items = []
+        self.index = dict()
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.index:
+            self.index[item] = len(self.items)
+            self.items.append(item)
+
+    def remove(self, item):
+        pos = self.index.pop(item)
+        last = self.items.pop()
+        if pos < len(self.items):
+            self.items[pos] = last
+            self.index[last] = pos
+
+    def discard(self, item):
+        if item in self.index:
+            self.remove(item)
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def __getitem__(self, pos):
+        return self.items[pos]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class CountTree:
+    """Non-negative counts by position, with O(log n) update and search (a Fenwick tree).
+
+    find(k) returns the position holding the k-th counted item, so that a uniform k below the
+    total picks positions with probability proportional to their counts. Positions beyond the
+    current size are added as needed.
+    """
+
+    def __init__(self, size=16):
+        self.counts = [0] * size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def add(self, pos, delta):
+        if pos >= len(self.counts):
+            self.resize(max(pos + 1, 2 * len(self.counts)))
+        self.counts[pos] += delta
+        self.total += delta
+        i = pos + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def resize(self, size):
+        self.counts += [0] * (size - len(self.counts))
+        self.tree = [0] + self.counts
+        for i in range(1, len(self.tree)):
+            j = i + (i & -i)
+            if j < len(self.tree):
+                self.tree[j] += self.tree[i]
+
+    def find(self, k):
+        # position of the item of rank k, for 0 <= k < total
+        pos = 0
+        bit = 1 << (len(self.tree) - 1).bit_length()
+        while bit:
+            nxt = pos + bit
+            if nxt < len(self.tree) and self.tree[nxt] <= k:
+                pos = nxt
+                k -= self.tree[nxt]
+            bit >>= 1
+        return pos
+
+    def __getitem__(self, pos):
+        return self.counts[pos] if pos < len(self.counts) else 0
+
+    def __len__(self):
+        return len(self.counts)
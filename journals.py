@@ -0,0 +1,293 @@
+# journals.py
+
+import os
+import multiprocessing
+from collections import namedtuple
+from multiprocessing import shared_memory
+import numpy as np
+from vectorized import VectorizedJournalModel
+from agents import LAZY, EAGER
+from indexed import IndexedSet
+from metrics import MetricsStore
+from sampling import DiscreteSampler
+
+# a journal receives a share of the submitted papers, requires 2 reviews with probability prob_2_reviews
+# (3 otherwise), and invites up to num_invites_per_review reviewers a day for each missing review
+Journal = namedtuple("Journal", ("share", "prob_2_reviews", "num_invites_per_review"))
+
+# researchers' state read by the journals when inviting reviewers
+SHARED_ARRAYS = ("num_tokens", "status", "tokens_to_submit", "yearly_reviews", "max_yearly_reviews")
+
+JOURNAL_COLUMNS = ("Submitted", "Submitted waiting reviewers", "Submitted in review", "Avg reviewing time 1y",
+                   "Avg reviewing time 1m", "Avg invites per paper 1y", "Avg invites per paper 1m")
+
+
+def parse_journals(spec):
+    # "SHARE:PROB_2_REVIEWS:INVITES_PER_REVIEW,..." (e.g. "0.6:0.73:1,0.4:0.5:2"); shares are normalized
+    journals = []
+    for item in spec.split(","):
+        share, prob_2_reviews, num_invites_per_review = item.split(":")
+        journals.append(Journal(float(share), float(prob_2_reviews), int(num_invites_per_review)))
+    return tuple(journals)
+
+
+class JournalShard(VectorizedJournalModel):
+    """The PMS of one journal: its submitted papers and the invitations of their reviewers.
+
+    The researchers' state is read from the arrays of a MultiJournalModel, as it is when the day's
+    invitations start; the reviews accepted during the day are counted apart and returned to the
+    model, which merges those of every journal.
+    """
+
+    def __init__(self, arrays, **params):
+        super().__init__(output_format="none", horizon=1, defer_population=True, **params)
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+    def start_day(self, step):
+        self.global_step = step
+        self.moving_average_rev_time.advance(step)
+        self.moving_average_inv_per_pap.advance(step)
+
+    def record_reviews(self, step, reviews_done):
+        # the reviews done today; returns the tokens earned by each, as in VectorizedJournalModel.do_reviews
+        self.start_day(step)
+        credits = []
+        for paper_id, rid, accepted_step in reviews_done:
+            paper = self.submitted_papers_dict.get(paper_id)
+            credits.append(0)
+            if paper is None:  # a reviewer invited twice, whose reviews were all counted by the first
+                continue
+            for j, (reviewer_id, done) in enumerate(paper.reviewers):
+                if reviewer_id == rid:
+                    if done == -1:
+                        paper.num_reviews_done += 1
+                    paper.reviewers[j] = (rid, step)
+                    credits[-1] += 1
+            self.moving_average_rev_time.add(credits[-1], credits[-1] * (step - accepted_step))
+            self.check_paper_reviewed(paper)
+        return credits
+
+    def day(self, step, submissions):
+        # the papers submitted today, then the invitations; returns the reviews accepted, the invites
+        # sent, today's reviews and completed papers for the moving averages, and the metrics
+        self.start_day(step)
+        for paper in submissions:
+            self.submitted_papers_dict[paper.ID] = paper
+            self.papers_waiting_reviewers[paper.ID] = paper
+
+        self.new_reviews = []
+        self.accepted_today = dict()  # reviews accepted today by researcher
+        self.lazy_today = set()  # eager researchers who accepted enough reviews today
+        invites_sent = self.invite_reviewers(IndexedSet(np.flatnonzero(self.status == EAGER).tolist()))
+        windows = (self.moving_average_rev_time.count_today(), self.moving_average_rev_time.total_today(),
+                   self.moving_average_inv_per_pap.count_today(), self.moving_average_inv_per_pap.total_today())
+        metrics = self.queue_sizes() + (self.moving_average_rev_time.mean(365), self.moving_average_rev_time.mean(30),
+                                        self.moving_average_inv_per_pap.mean(365), self.moving_average_inv_per_pap.mean(30))
+        return self.new_reviews, invites_sent, windows, metrics
+
+    def reviewer_status(self, reviewer):
+        return LAZY if reviewer in self.lazy_today else self.status[reviewer]
+
+    def reviewer_can_review(self, reviewer):
+        return (self.max_yearly_reviews[reviewer] == 0 or self.reviewer_status(reviewer) == EAGER
+                or self.yearly_reviews[reviewer] + self.accepted_today.get(reviewer, 0) < self.max_yearly_reviews[reviewer])
+
+    def accepts_invitation(self, paper, reviewer, accept):
+        return self.reviewer_can_review(reviewer) and accept <= self.prob_accept_review_invitation[self.reviewer_status(reviewer)]
+
+    def add_reviewer(self, paper, reviewer, eager_researchers):
+        status = self.reviewer_status(reviewer)
+        self.new_reviews.append((paper.ID, reviewer, status))
+        self.accepted_today[reviewer] = self.accepted_today.get(reviewer, 0) + 1
+        paper.reviewers.append((reviewer, -1))
+        if status == EAGER and self.author_needs_reviews_to_publish(reviewer):
+            self.lazy_today.add(reviewer)
+            eager_researchers.remove(reviewer)
+
+
+def shard_worker(connection, arrays, shards):
+    # runs the journals of a worker process: a message per phase of the day (the name of the
+    # JournalShard method), with the work of each journal
+    blocks, views = [], dict()
+    for name, (block_name, shape, dtype) in arrays.items():
+        # the blocks are unlinked by the MultiJournalModel that created them
+        blocks.append(shared_memory.SharedMemory(name=block_name))
+        views[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[-1].buf)
+    journals = [JournalShard(views, **params) for params in shards]
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        method, step, work = message
+        connection.send([getattr(journal, method)(step, journal_work) for journal, journal_work in zip(journals, work)])
+    connection.close()
+
+
+class MultiJournalModel(VectorizedJournalModel):
+    """JournalModel engine with several journals, each with its own PMS, sharing the same researchers.
+
+    Every paper is submitted to one of the `journals`, drawn by their share, and requires the number
+    of reviews drawn from the distribution of its journal (by default, a single journal with the
+    model's prob_2_reviews and num_invites_per_review). The researchers are kept by the model as in
+    VectorizedJournalModel; the submitted papers and the invitations of their reviewers are kept by
+    one JournalShard per journal, run in `processes` worker processes (by default one per journal, up
+    to the number of cores; with 0, in the model's process).
+    Every day, the model sends each journal the reviews done for its papers, and collects the tokens
+    they earn; then it sends the papers submitted to it, and collects the reviews accepted by the
+    researchers, which read the researchers' state from shared memory. The journals invite reviewers
+    independently, so a researcher can accept the invitations of more journals on the same day beyond
+    its maximum yearly reviews, or beyond the reviews it needs as Eager. Results do not depend on the
+    number of processes.
+    The metrics are the totals of all journals; those of each journal are in `journal_metrics`, one row
+    per journal and day (written to the journals-*.csv file). Checkpoints and warm starts are not supported.
+    """
+
+    def __init__(self, journals=None, processes=None, defer_population=False, **params):
+        if params.get("checkpoint") is not None:
+            raise ValueError("checkpoints are not supported by MultiJournalModel")
+        if params.get("backlog_of_papers_to_review"):
+            raise ValueError("warm starts (backlog_of_papers_to_review) are not supported by MultiJournalModel")
+        self.journal_results = []  # what each journal returned on the last day
+        self.workers = None
+        super().__init__(defer_population=True, **params)
+        self.journals = tuple(journals) if journals else (Journal(1.0, self.prob_2_reviews, self.num_invites_per_review),)
+        self.processes = min(len(self.journals), os.cpu_count()) if processes is None else processes
+        shares = np.array([journal.share for journal in self.journals], dtype=np.float64)
+        self.journal_cdf = np.cumsum(shares / shares.sum())
+        self.journal_num_reviews_samplers = [DiscreteSampler({2: journal.prob_2_reviews, 3: 1.0}) for journal in self.journals]
+        self.paper_journal = np.zeros(1024, dtype=np.int64)  # journal of every paper, by paper id
+        self.journal_metrics = MetricsStore(
+            dict({"Step": np.int64, "Journal": np.int64}, **{name: np.float64 for name in JOURNAL_COLUMNS}),
+            path=None if self.metrics_fname is None else os.path.join(os.path.dirname(self.metrics_fname), "journals-" + os.path.basename(self.metrics_fname).split("-", 1)[1]),
+            format="csv" if self.output_format == "none" else self.output_format,
+            flush_every=params.get("output_interval", 365) * len(self.journals),
+        )
+        if not defer_population:
+            self.build_population()
+
+    def init_researchers(self):
+        super().init_researchers()
+        self.submissions = [[] for _ in self.journals]
+        shards = []
+        for i, journal in enumerate(self.journals):
+            shard_seed = int(np.random.SeedSequence(self.seed, spawn_key=(3 + i,)).generate_state(1)[0])
+            shards.append(dict(self.params, prob_2_reviews=journal.prob_2_reviews, num_invites_per_review=journal.num_invites_per_review, seed=shard_seed))
+        if self.processes == 0:
+            self.shards = [JournalShard({name: getattr(self, name) for name in SHARED_ARRAYS}, **params) for params in shards]
+            return
+
+        # the shared arrays replace the model's, and the journals are dealt to the worker processes
+        self.blocks, arrays = [], dict()
+        for name in SHARED_ARRAYS:
+            values = getattr(self, name)
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            shared = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+            shared[:] = values
+            setattr(self, name, shared)
+            self.blocks.append(block)
+            arrays[name] = (block.name, values.shape, values.dtype.str)
+        context = multiprocessing.get_context("spawn")
+        self.workers = []
+        for p in range(self.processes):
+            journals = list(range(p, len(self.journals), self.processes))
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=shard_worker, args=(worker_connection, arrays, [shards[j] for j in journals]), daemon=True)
+            process.start()
+            self.workers.append((process, connection, journals))
+
+    def draw_num_reviews(self, n):
+        # the journals of the next n papers, by their share, and the reviews required by each journal
+        journals = np.searchsorted(self.journal_cdf, self.rng_generation.random(n), side="right").clip(max=len(self.journals) - 1)
+        num_reviews = np.empty(n, dtype=np.int64)
+        for j, sampler in enumerate(self.journal_num_reviews_samplers):
+            papers = journals == j
+            num_reviews[papers] = sampler.sample_many(np.count_nonzero(papers), self.rng_generation)
+        while len(self.paper_journal) < self.next_paper_id + n:
+            self.paper_journal = np.resize(self.paper_journal, 2 * len(self.paper_journal))
+        self.paper_journal[self.next_paper_id:self.next_paper_id + n] = journals
+        return num_reviews
+
+    def submit_paper(self, paper):
+        paper.submission_step = self.global_step
+        self.submissions[self.paper_journal[paper.ID]].append(paper)
+
+    def do_reviews(self):
+        # the reviews are recorded by the journals of their papers, which return the tokens each one earns
+        due = self.rev_scheduled == self.global_step
+        if not due.any():
+            return
+        rows = np.flatnonzero(due)
+        reviewers = self.rev_reviewer[rows]
+        paper_ids = self.rev_paper[rows]
+        accepted = self.rev_accepted[rows]
+        journals = self.paper_journal[paper_ids]
+        positions = [np.flatnonzero(journals == j) for j in range(len(self.journals))]
+        reviews_done = [list(zip(paper_ids[p].tolist(), reviewers[p].tolist(), accepted[p].tolist())) for p in positions]
+        credits = np.zeros(len(rows), dtype=np.int64)
+        for p, journal_credits in zip(positions, self.run_journals("record_reviews", reviews_done)):
+            credits[p] = journal_credits
+        if self.tokens_needed_to_submit():
+            np.add.at(self.num_tokens, reviewers, credits)
+        np.subtract.at(self.num_papers_to_review, reviewers, 1)
+
+        keep = ~due
+        self.rev_paper = self.rev_paper[keep]
+        self.rev_reviewer = self.rev_reviewer[keep]
+        self.rev_scheduled = self.rev_scheduled[keep]
+        self.rev_accepted = self.rev_accepted[keep]
+
+    def run_journals(self, method, work):
+        # a phase of the day of every journal (a JournalShard method, given its work), in parallel over the worker processes
+        if self.workers is None:
+            return [getattr(shard, method)(self.global_step, journal_work) for shard, journal_work in zip(self.shards, work)]
+        for process, connection, journals in self.workers:
+            connection.send((method, self.global_step, [work[j] for j in journals]))
+        results = [None] * len(self.journals)
+        for process, connection, journals in self.workers:
+            for j, result in zip(journals, connection.recv()):
+                results[j] = result
+        return results
+
+    def assign_reviews(self):
+        self.journal_results = self.run_journals("day", self.submissions)
+        self.submissions = [[] for _ in self.journals]
+        new_reviews = []
+        self.invites_sent_in_step = 0
+        for accepted, invites_sent, (reviews, review_time, papers, invites), metrics in self.journal_results:
+            new_reviews += accepted
+            self.invites_sent_in_step += invites_sent
+            self.moving_average_rev_time.add(reviews, review_time)
+            self.moving_average_inv_per_pap.add(papers, invites)
+        for paper_id, reviewer, status in new_reviews:
+            self.yearly_reviews[reviewer] += 1
+            if status == EAGER and self.status[reviewer] == EAGER and self.author_needs_reviews_to_publish(reviewer):
+                self.status[reviewer] = LAZY
+        self.schedule_reviews(new_reviews)
+        if __debug__ and self.trace.invites:
+            self.trace.log("invites", '%s reviews were accepted', len(new_reviews))
+
+    def queue_sizes(self):
+        return tuple(sum(metrics[i] for *_, metrics in self.journal_results) for i in range(3))
+
+    def collect_metrics(self):
+        super().collect_metrics()
+        for j, (*_, metrics) in enumerate(self.journal_results):
+            self.journal_metrics.record((self.global_step, j + 1) + metrics)
+
+    def save_checkpoint(self, path):
+        raise ValueError("checkpoints are not supported by MultiJournalModel")
+
+    def close(self):
+        super().close()
+        self.journal_metrics.flush()
+        if self.workers is not None:
+            for process, connection, journals in self.workers:
+                connection.send(None)
+                process.join()
+            self.workers = None
+            for name in SHARED_ARRAYS:  # the model's arrays outlive the shared memory
+                setattr(self, name, getattr(self, name).copy())
+            for block in self.blocks:
+                block.close()
+                block.unlink()
@@ -0,0 +1,81 @@
+# metrics.py
+
+import csv
+import time
+import numpy as np
+import pandas as pd
+
+FORMATS = ("csv", "parquet", "npy")
+
+
+class MetricsStore:
+    """Metrics of every step, kept in preallocated NumPy columns.
+
+    `columns` maps each column name to its dtype; one row is recorded per step, in columns sized
+    for `capacity` rows and doubled when they are full. If `path` is given, the rows are written
+    to it every `flush_every` rows and by flush(), in one of FORMATS: csv (appending the new rows),
+    parquet or npy (rewriting the whole table; npy files hold a structured array, which np.load
+    can memory-map). Rows before `first_row_written` are kept in memory only.
+    Mesa's visualization reads the metrics through get_model_vars_dataframe(), as from a DataCollector.
+    """
+
+    def __init__(self, columns, capacity=1024, path=None, format="csv", flush_every=365, first_row_written=0):
+        if format not in FORMATS:
+            raise ValueError(f"{format} is not an output format; use one of {FORMATS}")
+        if path is not None and format == "parquet":
+            pd.io.parquet.get_engine("auto")  # fails now rather than at the first write if pyarrow is missing
+        self.dtype = np.dtype(list(columns.items()))
+        self.data = np.zeros(max(capacity, 1), dtype=self.dtype)
+        self.num_rows = 0
+        self.path = path
+        self.format = format
+        self.flush_every = flush_every
+        self.first_row_written = first_row_written
+        self.rows_written = first_row_written
+        self.write_time = 0.0  # seconds spent writing the file
+        if path is not None and format == "csv":
+            with open(path, "w", newline="") as f:
+                csv.writer(f, lineterminator="\n").writerow(self.dtype.names)
+
+    def record(self, values):
+        if self.num_rows == len(self.data):
+            self.data = np.resize(self.data, 2 * len(self.data))
+        self.data[self.num_rows] = values
+        self.num_rows += 1
+        if self.path is not None and self.num_rows - self.rows_written >= self.flush_every:
+            self.flush()
+
+    def extend(self, rows, write=True):
+        # records many rows at once; with write=False they are kept in memory only, like those before
+        # first_row_written (only before any row is written)
+        if self.num_rows + len(rows) > len(self.data):
+            self.data = np.resize(self.data, max(2 * len(self.data), self.num_rows + len(rows)))
+        self.data[self.num_rows:self.num_rows + len(rows)] = rows
+        self.num_rows += len(rows)
+        if not write:
+            self.first_row_written = self.rows_written = self.num_rows
+        elif self.path is not None and self.num_rows - self.rows_written >= self.flush_every:
+            self.flush()
+
+    def column(self, name):
+        return self.data[name][:self.num_rows]
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.data[:self.num_rows])
+
+    def get_model_vars_dataframe(self):
+        return self.to_dataframe()
+
+    def flush(self):
+        if self.path is None or self.rows_written >= self.num_rows:
+            return
+        start = time.perf_counter()
+        if self.format == "csv":
+            with open(self.path, "a", newline="") as f:
+                csv.writer(f, lineterminator="\n").writerows(self.data[self.rows_written:self.num_rows].tolist())
+        elif self.format == "parquet":
+            self.to_dataframe().iloc[self.first_row_written:].to_parquet(self.path, index=False)
+        else:
+            np.save(self.path, self.data[self.first_row_written:self.num_rows])
+        self.rows_written = self.num_rows
+        self.write_time += time.perf_counter() - start
@@ -1,16 +1,43 @@
+import gc
 import math
+import os
 import numpy as np
 import time
 import datetime
 import logging
+from operator import attrgetter
 from mesa import Model
-from mesa.datacollection import DataCollector
-from agents import Researcher, Paper
+from agents import Researcher, Paper, LAZY, EAGER, STATUS_NAMES
+from windows import SlidingWindow
+from tracing import Tracer, CATEGORIES
+from indexed import IndexedSet
+from sampling import DiscreteSampler
+from metrics import MetricsStore, FORMATS
+from stopping import StoppingRule
+from warmstart import warm_state
+from checkpoint import (read_checkpoint, write_checkpoint, papers_to_arrays, arrays_to_papers, steps_to_arrays, arrays_to_steps,
+                        random_state, set_random_state, window_state, set_window_state)
 import random
 
-
-import matplotlib.pyplot as plt
-plt.rcParams["figure.figsize"] = (8, 4)
+REVIEW_TIME = {  # cumulative distribution of the reviewing times (in days) by reviewer status
+    "L": {10: 0.063, 20: 0.107, 30: 0.145, 40: 0.201, 50: 0.289,
+          60: 0.358, 70: 0.440, 80: 0.503, 90: 0.767, 100: 0.843,
+          110: 0.899, 120: 0.931, 130: 0.950, 140: 0.969, 170: 0.981,
+          180: 0.987, 200: 1.000},
+    "E": {7: 1.000}
+}
+
+# phases of a step and events counted with instrumentation=True
+PHASES = ("maintenance", "researchers", "assign reviews", "metrics")
+EVENT_COUNTS = ("Papers generated", "Reviews completed", "Invites sent", "Reviews accepted")
+
+# parameters of JournalModel that do not affect the simulation
+NON_SIMULATION_PARAMS = ("self", "__class__", "verbose_logging", "simulator", "trace_categories", "trace_binary", "output_dir",
+                         "output_format", "output_interval", "horizon", "seed", "checkpoint", "output_restored_metrics", "defer_population",
+                         "instrumentation", "stop_early", "stop_window", "stop_tolerance")
+# parameters a run restored from a checkpoint may change, as the saved state does not depend on them
+# (initial_tokens too, but only before tokens are needed; see check_checkpoint)
+RESTORE_OVERRIDES = ("prob_accept_L", "prob_accept_E")
 
 class JournalModel(Model):
     def __init__(
@@ -30,28 +57,95 @@ class JournalModel(Model):
         max_yearly_reviews_per_author=0,
         max_yearly_reviews_per_author_distribution="Yes",
         simulator=None,
+        trace_categories=(),
+        trace_binary=False,
+        output_dir=".",
+        output_format="csv",
+        output_interval=365,
+        horizon=3650,
+        seed=None,
+        checkpoint=None,
+        output_restored_metrics=False,
+        defer_population=False,
+        instrumentation=False,
+        stop_early=False,
+        stop_window=365,
+        stop_tolerance=0.05,
     ):
-        super().__init__()
-
-        # Logs
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
-        log_fname = f"log-{timestamp}.txt"
-        self.logger = logging.getLogger(f"JournalModel-{timestamp}")
-        self.logger.setLevel(logging.DEBUG)
-        fh = logging.FileHandler(log_fname, mode="w")
-        fh.setFormatter(logging.Formatter("%(asctime)s  %(message)s"))
-        self.logger.addHandler(fh)
-        # optional: prevent double‐logging to root
-        self.logger.propagate = False
-
-        # CSV
-        self.csv_fname = f"csv-{timestamp}.csv"
-        self.csv_file = open(self.csv_fname, "w")
-
-        self.csv_file.write(
-            "Step,Submitted,Submitted waiting reviewers,Submitted in review,Avg reviewing time 1y,Avg reviewing time 1m,Avg invites per paper 1y,Avg invites per paper 1m\n"
+        # parameters of the simulation, saved in checkpoints
+        self.params = {name: value for name, value in locals().items() if name not in NON_SIMULATION_PARAMS}
+        # a run restored from a checkpoint continues its random streams, unless a new seed is given
+        restored = read_checkpoint(checkpoint) if checkpoint is not None else None
+        if restored is not None:
+            self.check_checkpoint(restored[1])
+        keep_random_state = restored is not None and seed is None
+        # a run is reproduced by passing the seed it recorded in its log file
+        if seed is None:
+            seed = restored[1]["seed"] if restored is not None else np.random.SeedSequence().entropy
+        super().__init__(seed=seed)
+        self.seed = seed
+        # independent random streams for the generation of papers, the invitations of reviewers and the
+        # reviewing times, so that changing how one kind of event is drawn does not alter the others
+        streams = np.random.SeedSequence(seed).spawn(3)
+        self.random_generation, self.random_review_times = (random.Random(int(s.generate_state(1)[0])) for s in (streams[0], streams[2]))
+        self.rng_invitations = np.random.default_rng(streams[1])  # the invitations of each day are drawn at once
+        # batched draws of the vectorized engine
+        self.rng_generation = np.random.default_rng(streams[0].spawn(1)[0])
+        self.rng_review_times = np.random.default_rng(streams[2].spawn(1)[0])
+
+        # Logs and metrics files, unless file outputs are disabled (output_format="none")
+        if output_format not in FORMATS + ("none",):
+            raise ValueError(f"{output_format} is not an output format; use one of {FORMATS + ('none',)}")
+        self.output_format = output_format
+        self.logger = logging.Logger("JournalModel", logging.DEBUG)  # not registered, so every model has its own
+        if output_format == "none":
+            trace_fname = self.metrics_fname = None
+            self.logger.addHandler(logging.NullHandler())
+        else:
+            timestamp = self.claim_output_timestamp(output_dir)
+            trace_fname = os.path.join(output_dir, f"log-{timestamp}.trace")
+            self.metrics_fname = os.path.join(output_dir, f"csv-{timestamp}.csv" if output_format == "csv" else f"metrics-{timestamp}.{output_format}")
+            fh = logging.FileHandler(os.path.join(output_dir, f"log-{timestamp}.txt"), mode="w")
+            fh.setFormatter(logging.Formatter("%(asctime)s  %(message)s"))
+            self.logger.addHandler(fh)
+        self.logger.info("Seed %s", seed)
+        if checkpoint is not None:
+            self.logger.info("Restored from the checkpoint %s", checkpoint)
+        # verbose logging traces every category of events
+        self.trace = Tracer(CATEGORIES if verbose_logging else tuple(trace_categories), logger=self.logger, path=trace_fname, binary=trace_binary)
+
+        # Metrics of every step; the row of the initial state (step 0) is not written to the file, nor are
+        # the rows restored from a checkpoint unless output_restored_metrics is set
+        columns = {
+            "Step": np.int64,
+            "Submitted": np.int64,
+            "Submitted waiting reviewers": np.int64,
+            "Submitted in review": np.int64,
+            "Avg reviewing time 1y": np.float64,
+            "Avg reviewing time 1m": np.float64,
+            "Avg invites per paper 1y": np.float64,
+            "Avg invites per paper 1m": np.float64,
+        }
+        # with instrumentation, also the wall time of each phase of the step and the number of events
+        self.instrumentation = instrumentation
+        if instrumentation:
+            columns.update({f"Time {phase} (ms)": np.float64 for phase in PHASES})
+            columns.update({name: np.int64 for name in EVENT_COUNTS})
+        self.phase_times = (0.0,) * len(PHASES)
+        self.invites_sent_in_step = 0
+        self.metrics = MetricsStore(
+            columns,
+            capacity=horizon + 1,
+            path=self.metrics_fname,
+            format="csv" if output_format == "none" else output_format,
+            flush_every=output_interval,
+            first_row_written=1,
         )
-        self.csv_file.flush()
+        self.datacollector = self.metrics  # read by Mesa's visualization
+        self.output_restored_metrics = output_restored_metrics
+        # with stop_early, the run stops (running = False) once its metrics have settled or diverged
+        self.stopping_rule = StoppingRule(window=stop_window, tolerance=stop_tolerance) if stop_early else None
+        self.stop_reason = None
 
         self.simulator = simulator
         if self.simulator is not None:
@@ -62,7 +156,7 @@ class JournalModel(Model):
         self.initial_tokens = initial_tokens
         self.daily_submission_prob = daily_submission_prob
         self.prob_2_reviews = prob_2_reviews
-        self.prob_accept_review_invitation = {"L": prob_accept_L, "E": prob_accept_E}
+        self.prob_accept_review_invitation = (prob_accept_L, prob_accept_E)  # indexed by status
         self.verbose_logging = verbose_logging
         self.no_tokens_to_submit = no_tokens_to_submit
         self.num_invites_per_review = num_invites_per_review
@@ -71,13 +165,10 @@ class JournalModel(Model):
         self.max_yearly_reviews_per_author=max_yearly_reviews_per_author
         self.max_yearly_reviews_per_author_distribution=max_yearly_reviews_per_author_distribution
 
-        self.review_time = {
-            "L": {10: 0.063, 20: 0.107, 30: 0.145, 40: 0.201, 50: 0.289,
-                  60: 0.358, 70: 0.440, 80: 0.503, 90: 0.767, 100: 0.843,
-                  110: 0.899, 120: 0.931, 130: 0.950, 140: 0.969, 170: 0.981,
-                  180: 0.987, 200: 1.000},
-            "E": {7: 1.000}
-        }
+        self.review_time = REVIEW_TIME
+        # distributions compiled once for sampling; review times include a jitter of up to 10 days
+        self.review_time_sampler = tuple(DiscreteSampler(self.review_time[name], jitter=10) for name in STATUS_NAMES)  # indexed by status
+        self.num_reviews_sampler = DiscreteSampler({2: self.prob_2_reviews, 3: 1.0})
 
         self.reviewers_distributions = { 
                 10: 8386,
@@ -115,68 +206,106 @@ class JournalModel(Model):
 
         self.global_step = 0
         self.next_paper_id = 1
-        self.submitted_papers = []
         self.submitted_papers_dict = {}  ### maps paper_id to paper object
+        self.papers_waiting_reviewers = {}  # submitted papers with missing reviewers, in order of submission
+        self.papers_in_review = {}  # submitted papers with all their reviewers, waiting for the reviews
         self.submitted_papers_missing_reviewers = 0
 
+        # Calendar of the researchers' events: maps step to the ids of the researchers who will generate a paper or do a review
+        self.calendar = dict()
+        self.researchers_needing_reviews = set()  # researchers who need to earn tokens to submit their papers
+        self.researchers_changing_status = set()  # researchers whose status changed in the last step
+        self.eager_researchers = IndexedSet()  # ids of the eager researchers, to give them priority when inviting reviewers
+
+        # Ids of the researchers who accepted a review or generated a paper, per step; used to age the yearly counters
+        self.reviews_accepted_per_step = dict()
+        self.papers_generated_per_step = dict()
+
         self.sum_count_rev_time_per_paper = (0,0)
         self.avg_rev_time_per_paper_1y = 0
         self.avg_rev_time_per_paper_1m = 0
         self.avg_invites_per_paper_1y = 0
         self.avg_invites_per_paper_1m = 0
-        self.moving_average_rev_time_dict = dict()
-        self.moving_average_inv_per_pap_dict = dict()
-
-        self.researchers = dict()
-        if(self.max_yearly_reviews_per_author_distribution=="Yes"):
-            yearly_reviews_to_be_stable = int(365 * self.daily_submission_prob * (3 - self.prob_2_reviews))
-            for (k,v) in self.reviewers_distributions.items():
-                for j in range(v):
-                    i = len(self.researchers)
-                    self.researchers[i] = Researcher(i, k, self)
-                    # self.logger.debug(f"Adding researcher {i} with {k} yearly reviews")
-            for i in range(len(self.researchers), self.num_authors):
-                self.researchers[i] = Researcher(i, yearly_reviews_to_be_stable, self)
-                # self.logger.debug(f"Adding researcher {i} with {yearly_reviews_to_be_stable} yearly reviews to be stable")
-            # self.logger.debug(f"Total {len(self.researchers)} reviewers")
+        self.moving_average_rev_time = SlidingWindow((30, 365))  # reviews done and sum of their reviewing times
+        self.moving_average_inv_per_pap = SlidingWindow((30, 365))  # papers fully assigned and sum of their invites
+
+        # with defer_population the researchers are built by the first step, so that creating a model is immediate
+        self.population_ready = restored is not None
+        if restored is None:
+            if not defer_population:
+                self.build_population()
+            self.collect_metrics()
         else:
-            self.researchers = {i: Researcher(i, 0, self) for i in range(self.num_authors)}
-
-        
- 
-        self.datacollector = DataCollector(
-            model_reporters={
-                "Submitted": lambda m: len(m.submitted_papers),
-                "Submitted waiting reviewers": lambda m: m.submitted_papers_missing_reviewers,
-                "Submitted in review": lambda m: len(m.submitted_papers)-m.submitted_papers_missing_reviewers,
-                "Avg reviewing time 1y": lambda m: m.avg_rev_time_per_paper_1y,
-                "Avg reviewing time 1m": lambda m: m.avg_rev_time_per_paper_1m,
-                "Avg invites per paper 1y": lambda m: m.avg_invites_per_paper_1y,
-                "Avg invites per paper 1m": lambda m: m.avg_invites_per_paper_1m,
-            }
-        )
-        self.datacollector.collect(self)      
+            self.restore_checkpoint(*restored, keep_random_state)
 
         self.running = True
 
-    def verboseLog(self, msg):
-        if self.verbose_logging:
-            self.logger.debug(msg)
-
-    def coin_toss(self, distribution):
-        n = random.random()
-        for k, v in sorted(distribution.items()):
-            if v >= n:
-                return k
-        return max(distribution.keys())
+    def researchers_max_yearly_reviews(self):
+        # maximum number of yearly reviews of each researcher, indexed by researcher id
+        if(self.max_yearly_reviews_per_author_distribution=="Yes"):
+            yearly_reviews_to_be_stable = int(365 * self.daily_submission_prob * (3 - self.prob_2_reviews))
+            max_yearly_reviews = np.repeat(list(self.reviewers_distributions.keys()), list(self.reviewers_distributions.values()))
+            return np.concatenate([max_yearly_reviews, np.full(max(self.num_authors - len(max_yearly_reviews), 0), yearly_reviews_to_be_stable)])
+        else:
+            return np.zeros(self.num_authors, dtype=np.int64)
+
+    def init_researchers(self):
+        max_yearly_reviews = self.researchers_max_yearly_reviews().tolist()
+        gc_enabled = gc.isenabled()
+        gc.disable()  # the researchers are not cyclic garbage; scanning them while they are created is wasted time
+        try:
+            self.researchers = {i: Researcher(i, k, self) for i, k in enumerate(max_yearly_reviews)}
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if self.daily_submission_prob <= 0:
+            return
+        # first papers of all the researchers, with the same draws as schedule_paper_generation
+        steps = np.array(self.draw_paper_generation_days(len(max_yearly_reviews)), dtype=np.int64) + self.global_step
+        for researcher, step in zip(self.researchers.values(), steps.tolist()):
+            researcher.next_paper_step = step
+        order = np.argsort(steps, kind="stable")
+        bounds = np.flatnonzero(np.diff(steps[order])) + 1
+        for ids in np.split(order, bounds):
+            if len(ids):
+                self.calendar.setdefault(int(steps[ids[0]]), set()).update(ids.tolist())
+
+    def draw_paper_generation_days(self, n):
+        # n draws of the days until the next paper, as in schedule_paper_generation
+        if self.daily_submission_prob >= 1:
+            return [1] * n
+        log_q = math.log(1.0 - self.daily_submission_prob)
+        rand = self.random_generation.random
+        return [int(math.log(1.0 - rand()) / log_q) + 1 for _ in range(n)]
+
+    def schedule(self, agent, step):
+        self.calendar.setdefault(step, set()).add(agent.unique_id)
+
+    def schedule_paper_generation(self, agent):
+        # days until the next paper are geometrically distributed with the daily generation probability
+        if self.daily_submission_prob <= 0:
+            return
+        if self.daily_submission_prob >= 1:
+            days = 1
+        else:
+            days = int(math.log(1.0 - self.random_generation.random()) / math.log(1.0 - self.daily_submission_prob)) + 1
+        agent.next_paper_step = self.global_step + days
+        self.schedule(agent, agent.next_paper_step)
+
+    def build_population(self):
+        # builds the researchers of a model created with defer_population=True
+        if not self.population_ready:
+            self.init_researchers()
+            if self.backlog_of_papers_to_review:
+                self.warm_start()
+            self.population_ready = True
 
     def step(self):
         
         ##########
         ## INITIALIZE METRICS
         ##########
-        if(self.global_step == 0):
-            self.datacollector.collect(self)
+        self.build_population()
         self.global_step += 1
         self.reviews_done_in_step = 0
         self.reviews_done_in_step_per_status = dict()
@@ -197,8 +326,6 @@ class JournalModel(Model):
         self.num_transition_l2e = 0
         self.num_transition_l2e2l = 0
 
-        self.moving_average_rev_time_dict[self.global_step] = (0,0)
-        self.moving_average_inv_per_pap_dict[self.global_step] = (0,0)
         self.moving_average_rev_per_res = []
         self.moving_average_gen_per_aut = []
         
@@ -208,15 +335,28 @@ class JournalModel(Model):
         self.heatmap_rev_vs_gen = dict()
         self.heatmap_rev_vs_max = dict()
 
+        ##########
+        ## MAINTENANCE
+        ##########
+        if self.instrumentation:
+            start = time.perf_counter()
+        self.maintenance()
+        if self.instrumentation:
+            maintenance_end = time.perf_counter()
+
         ##########
         ## RUN SIMULATION
         ##########
-        self.verboseLog(f"*** Step {self.global_step} started ***")
+        if __debug__ and self.trace.enabled:
+            self.trace.log("step", "*** Step %s started ***", self.global_step)
     
-        for researcher in self.researchers.values():
-            researcher.step()
+        self.researchers_actions()
+        if self.instrumentation:
+            researchers_end = time.perf_counter()
 
         self.assign_reviews()
+        if self.instrumentation:
+            assign_end = time.perf_counter()
 
         ##########
         ## COLLECT METRICS
@@ -232,23 +372,258 @@ class JournalModel(Model):
             self.tot_invites = 0
             self.avg_invites_per_paper = 0
 
-        self.avg_rev_time_per_paper_1y = sum([v[1] for (k,v) in self.moving_average_rev_time_dict.items() if k >= self.global_step-365]) / sum([v[0] for (k,v) in self.moving_average_rev_time_dict.items() if k >= self.global_step-365]) if sum([v[0] for (k,v) in self.moving_average_rev_time_dict.items() if k >= self.global_step-365]) > 0 else 0
-        self.avg_rev_time_per_paper_1m = sum([v[1] for (k,v) in self.moving_average_rev_time_dict.items() if k >= self.global_step-30]) / sum([v[0] for (k,v) in self.moving_average_rev_time_dict.items() if k >= self.global_step-30]) if sum([v[0] for (k,v) in self.moving_average_rev_time_dict.items() if k >= self.global_step-365]) > 0 else 0
-
-        self.avg_invites_per_paper_1y = sum([v[1] for (k,v) in self.moving_average_inv_per_pap_dict.items() if k >= self.global_step-365]) / sum([v[0] for (k,v) in self.moving_average_inv_per_pap_dict.items() if k >= self.global_step-365]) if sum([v[0] for (k,v) in self.moving_average_inv_per_pap_dict.items() if k >= self.global_step-365]) > 0 else 0
-        self.avg_invites_per_paper_1m = sum([v[1] for (k,v) in self.moving_average_inv_per_pap_dict.items() if k >= self.global_step-30]) / sum([v[0] for (k,v) in self.moving_average_inv_per_pap_dict.items() if k >= self.global_step-30]) if sum([v[0] for (k,v) in self.moving_average_inv_per_pap_dict.items() if k >= self.global_step-365]) > 0 else 0
-        
-        self.submitted_papers_missing_reviewers = len(self.submitted_papers)
-        for paper in self.submitted_papers[:]:
-            if len(paper.reviewers) == paper.num_reviews:
-                self.submitted_papers_missing_reviewers -= 1
-
-        self.datacollector.collect(self)
-        
-        self.csv_file.write(
-            f"{self.global_step},{len(self.submitted_papers)},{self.submitted_papers_missing_reviewers},{len(self.submitted_papers)-self.submitted_papers_missing_reviewers},{self.avg_rev_time_per_paper_1y},{self.avg_rev_time_per_paper_1m},{self.avg_invites_per_paper_1y},{self.avg_invites_per_paper_1m}\n"
+        self.avg_rev_time_per_paper_1y = self.moving_average_rev_time.mean(365)
+        self.avg_rev_time_per_paper_1m = self.moving_average_rev_time.mean(30)
+
+        self.avg_invites_per_paper_1y = self.moving_average_inv_per_pap.mean(365)
+        self.avg_invites_per_paper_1m = self.moving_average_inv_per_pap.mean(30)
+
+        self.submitted_papers_missing_reviewers = len(self.papers_waiting_reviewers)
+
+        if self.instrumentation:
+            self.phase_times = (maintenance_end - start, researchers_end - maintenance_end, assign_end - researchers_end, time.perf_counter() - assign_end)
+        self.collect_metrics()
+        if self.stopping_rule is not None:
+            self.check_stopping()
+        if self.trace.enabled:
+            self.trace.flush()
+
+    def collect_metrics(self):
+        values = (
+            self.global_step,
+            *self.queue_sizes(),
+            self.avg_rev_time_per_paper_1y,
+            self.avg_rev_time_per_paper_1m,
+            self.avg_invites_per_paper_1y,
+            self.avg_invites_per_paper_1m,
         )
-        self.csv_file.flush()
+        if self.instrumentation:
+            # the time of the metrics phase does not include the time of recording it (and of writing the files)
+            values += tuple(t * 1000 for t in self.phase_times) + (
+                len(self.papers_generated_per_step.get(self.global_step, ())),
+                self.moving_average_rev_time.count_today(),
+                self.invites_sent_in_step,
+                len(self.reviews_accepted_per_step.get(self.global_step, ())),
+            )
+        self.metrics.record(values)
+
+    def check_stopping(self):
+        # the trajectory is compared only after tokens are needed, when the regime changes
+        start = 0 if self.no_tokens_to_submit else self.num_days_with_no_tokens_needed
+        reason = self.stopping_rule.check(self.metrics, max(start, self.num_days_with_no_stats))
+        if reason is not None:
+            self.running = False
+            self.stop_reason = reason
+            self.logger.info("Run stopped: %s", reason)
+
+    def queue_sizes(self):
+        # papers submitted, of which waiting for reviewers and in review
+        return len(self.submitted_papers_dict), len(self.papers_waiting_reviewers), len(self.papers_in_review)
+
+    def instrumentation_summary(self):
+        # totals of the instrumentation columns over the steps run so far
+        steps = self.metrics.column("Step") > 0
+        total_time = sum(self.metrics.column(f"Time {phase} (ms)")[steps].sum() for phase in PHASES)
+        lines = [f"{steps.sum()} steps, {total_time / 1000:.2f} s"]
+        for phase in PHASES:
+            times = self.metrics.column(f"Time {phase} (ms)")[steps]
+            lines.append(f"  {phase}: {times.sum() / 1000:.2f} s ({times.sum() / max(total_time, 1e-9):.0%}), "
+                         f"{times.mean() if len(times) else 0:.2f} ms/step, max {times.max() if len(times) else 0:.2f} ms")
+        lines.append(f"  writing the metrics files: {self.metrics.write_time:.2f} s")
+        lines.append("  " + ", ".join(f"{name.lower()}: {self.metrics.column(name)[steps].sum()}" for name in EVENT_COUNTS))
+        return "\n".join(lines)
+
+    @staticmethod
+    def claim_output_timestamp(output_dir):
+        # timestamp in the names of the output files, followed by a counter for models created in the same second
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
+        claimed, n = timestamp, 0
+        while True:
+            try:
+                open(os.path.join(output_dir, f"log-{claimed}.txt"), "x").close()
+                return claimed
+            except FileExistsError:
+                n += 1
+                claimed = f"{timestamp}-{n}"
+
+    def close(self):
+        # writes the metrics not yet written and closes the output files
+        self.metrics.flush()
+        self.trace.close()
+        for handler in self.logger.handlers:
+            handler.close()
+
+    ##########
+    ## CHECKPOINTS
+    ##########
+    def save_checkpoint(self, path):
+        # see checkpoint.py
+        self.build_population()
+        arrays, pending_papers = self.researchers_state()
+        arrays.update(papers_to_arrays(pending_papers + list(self.submitted_papers_dict.values())))
+        arrays["paper_in_review"] = np.array(list(self.papers_in_review), dtype=np.int64)
+        arrays.update(steps_to_arrays("reviews_accepted", self.reviews_accepted_per_step))
+        arrays.update(steps_to_arrays("papers_generated", self.papers_generated_per_step))
+        arrays["metrics"] = self.metrics.data[:self.metrics.num_rows]
+        state = {
+            "engine": type(self).__name__,
+            "params": self.params,
+            "seed": self.seed,
+            "global_step": self.global_step,
+            "next_paper_id": self.next_paper_id,
+            "running": self.running,
+            "averages": [self.avg_rev_time_per_paper_1y, self.avg_rev_time_per_paper_1m, self.avg_invites_per_paper_1y, self.avg_invites_per_paper_1m],
+            "moving_average_rev_time": window_state(self.moving_average_rev_time),
+            "moving_average_inv_per_pap": window_state(self.moving_average_inv_per_pap),
+            "random": {name: random_state(getattr(self, name)) for name in ("random", "random_generation", "random_review_times")},
+            "rng": {name: getattr(self, name).bit_generator.state for name in ("rng", "rng_generation", "rng_invitations", "rng_review_times")},
+        }
+        write_checkpoint(path, arrays, state)
+
+    def restore_checkpoint(self, arrays, state, keep_random_state=True):
+        # the cyclic garbage collector would scan the heap over and over while the papers are built
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.restore_state(arrays, state, keep_random_state)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def check_checkpoint(self, state):
+        # raises if the checkpoint cannot be restored with the model's parameters; called before any output file is created
+        if state["engine"] != type(self).__name__:
+            raise ValueError(f"the checkpoint was saved by {state['engine']} and cannot be restored by {type(self).__name__}")
+        saved = state["params"]
+        mismatched = [name for name, value in saved.items()
+                      if name in self.params and name not in RESTORE_OVERRIDES + ("initial_tokens",) and value != self.params[name]]
+        if mismatched:
+            raise ValueError("the checkpoint was saved with different " + ", ".join(f"{name} ({saved[name]!r}, not {self.params[name]!r})" for name in mismatched))
+        # researchers still have their initial tokens only if tokens were not needed yet
+        if (saved["initial_tokens"] != self.params["initial_tokens"] and not saved["no_tokens_to_submit"]
+                and state["global_step"] > saved["num_days_with_no_tokens_needed"]):
+            raise ValueError("initial_tokens can be changed only for checkpoints saved before tokens are needed")
+
+    def restore_state(self, arrays, state, keep_random_state):
+        saved = state["params"]
+        arrays = dict(arrays)
+        if saved["initial_tokens"] != self.initial_tokens:
+            arrays["num_tokens"] = arrays["num_tokens"] + (self.initial_tokens - saved["initial_tokens"])
+
+        self.global_step = state["global_step"]
+        self.next_paper_id = state["next_paper_id"]
+        self.running = state["running"]
+        self.avg_rev_time_per_paper_1y, self.avg_rev_time_per_paper_1m, self.avg_invites_per_paper_1y, self.avg_invites_per_paper_1m = state["averages"]
+        set_window_state(self.moving_average_rev_time, state["moving_average_rev_time"])
+        set_window_state(self.moving_average_inv_per_pap, state["moving_average_inv_per_pap"])
+        if keep_random_state:
+            for name, value in state["random"].items():
+                set_random_state(getattr(self, name), value)
+            for name, value in state["rng"].items():
+                getattr(self, name).bit_generator.state = value
+
+        pending_papers = []
+        for paper in arrays_to_papers(arrays):
+            if paper.submission_step is None:
+                pending_papers.append(paper)
+            else:
+                self.submitted_papers_dict[paper.ID] = paper
+        self.restore_queues(arrays["paper_in_review"].tolist())
+        self.restore_researchers(arrays, pending_papers)
+        # the metrics of the steps before the checkpoint, already written by the run that saved it
+        saved = arrays["metrics"]
+        rows = np.zeros(len(saved), dtype=self.metrics.dtype)
+        for name in rows.dtype.names:
+            if name in saved.dtype.names:  # the instrumentation columns may differ
+                rows[name] = saved[name]
+        self.metrics.extend(rows, write=self.output_restored_metrics)
+
+    def restore_queues(self, in_review):
+        # the submitted papers are waiting for reviewers, except those in review (in the given order)
+        in_review_set = set(in_review)
+        self.papers_waiting_reviewers = {ID: paper for ID, paper in self.submitted_papers_dict.items() if ID not in in_review_set}
+        self.papers_in_review = {ID: self.submitted_papers_dict[ID] for ID in in_review}
+        self.submitted_papers_missing_reviewers = len(self.papers_waiting_reviewers)
+
+    def researchers_state(self):
+        # arrays of the researchers' state and their papers to submit, in order of researcher id
+        researchers = list(self.researchers.values())
+        reviews = [(r.unique_id,) + review for r in researchers for review in r.papers_to_review]
+        arrays = {
+            "num_tokens": np.array([r.num_tokens for r in researchers], dtype=np.int64),
+            "status": np.array([r.status for r in researchers], dtype=np.int8),
+            "prev_status": np.array([r.prev_status for r in researchers], dtype=np.int8),
+            "yearly_reviews": np.array([r.yearly_reviews for r in researchers], dtype=np.int64),
+            "yearly_generations": np.array([r.yearly_generations for r in researchers], dtype=np.int64),
+            "next_paper_step": np.array([-1 if r.next_paper_step is None else r.next_paper_step for r in researchers], dtype=np.int64),
+            "eager_researchers": np.array(list(self.eager_researchers), dtype=np.int64),  # in the order used to pick reviewers
+            "researchers_needing_reviews": np.array(sorted(self.researchers_needing_reviews), dtype=np.int64),
+            "researchers_changing_status": np.array(sorted(self.researchers_changing_status), dtype=np.int64),
+        }
+        for i, name in enumerate(("reviewer", "paper", "scheduled", "status", "accepted")):
+            arrays[f"review_{name}"] = np.array([review[i] for review in reviews], dtype=np.int64)
+        arrays.update(steps_to_arrays("calendar", {step: sorted(ids) for step, ids in self.calendar.items()}))
+        return arrays, [paper for r in researchers for paper in r.papers_to_submit]
+
+    def restore_researchers(self, arrays, pending_papers):
+        self.reviews_accepted_per_step = arrays_to_steps("reviews_accepted", arrays)
+        self.papers_generated_per_step = arrays_to_steps("papers_generated", arrays)
+        self.researchers = {i: Researcher(i, k, self) for i, k in enumerate(self.researchers_max_yearly_reviews().tolist())}
+        columns = (arrays[name].tolist() for name in ("num_tokens", "status", "prev_status", "yearly_reviews", "yearly_generations", "next_paper_step"))
+        for researcher, num_tokens, status, prev_status, yearly_reviews, yearly_generations, next_paper_step in zip(self.researchers.values(), *columns):
+            researcher.num_tokens = num_tokens
+            researcher.status = status
+            researcher.prev_status = prev_status
+            researcher.yearly_reviews = yearly_reviews
+            researcher.yearly_generations = yearly_generations
+            researcher.next_paper_step = None if next_paper_step == -1 else next_paper_step
+        columns = (arrays[f"review_{name}"].tolist() for name in ("reviewer", "paper", "scheduled", "status", "accepted"))
+        for rid, paper_id, scheduled_step, status, accepted_step in zip(*columns):
+            self.researchers[rid].papers_to_review.append((paper_id, scheduled_step, status, accepted_step))
+        for paper in pending_papers:
+            self.researchers[paper.author_id].papers_to_submit.append(paper)
+        self.eager_researchers = IndexedSet(arrays["eager_researchers"].tolist())
+        self.researchers_needing_reviews = set(arrays["researchers_needing_reviews"].tolist())
+        self.researchers_changing_status = set(arrays["researchers_changing_status"].tolist())
+        self.calendar = {step: set(ids) for step, ids in arrays_to_steps("calendar", arrays).items()}
+
+    ##########
+    ## WARM START
+    ##########
+    def warm_start(self):
+        # papers in review, reviews to do and histories of the last 365 days as at the equilibrium of the
+        # period before tokens are needed, generated at once (see warmstart.py) rather than simulated
+        arrays = warm_state(self, self.backlog_of_papers_to_review, self.rng_generation)
+        self.warm_start_researchers(arrays)
+        for paper in arrays_to_papers(arrays):
+            self.submitted_papers_dict[paper.ID] = paper
+        self.restore_queues(arrays["paper_in_review"].tolist())
+        self.next_paper_id = len(arrays["paper_id"]) + 1
+        for window, name in ((self.moving_average_rev_time, "rev_time"), (self.moving_average_inv_per_pap, "inv_per_pap")):
+            window.step = -365  # the days of the history, up to step 0
+            for day, count, total in zip(range(-365, 1), arrays[f"{name}_count"].tolist(), arrays[f"{name}_total"].tolist()):
+                window.advance(day)
+                window.add(count, total)
+        self.avg_rev_time_per_paper_1y = self.moving_average_rev_time.mean(365)
+        self.avg_rev_time_per_paper_1m = self.moving_average_rev_time.mean(30)
+        self.avg_invites_per_paper_1y = self.moving_average_inv_per_pap.mean(365)
+        self.avg_invites_per_paper_1m = self.moving_average_inv_per_pap.mean(30)
+
+    def warm_start_researchers(self, arrays):
+        # the reviews to do (all accepted by Lazy reviewers) and the yearly counters of the warm start
+        columns = (arrays[f"review_{name}"].tolist() for name in ("reviewer", "paper", "scheduled", "accepted"))
+        for rid, paper_id, scheduled_step, accepted_step in zip(*columns):
+            researcher = self.researchers[rid]
+            researcher.papers_to_review.append((paper_id, scheduled_step, LAZY, accepted_step))
+            self.schedule(researcher, scheduled_step)
+        self.reviews_accepted_per_step = arrays_to_steps("reviews_accepted", arrays)
+        self.papers_generated_per_step = arrays_to_steps("papers_generated", arrays)
+        yearly_reviews = np.bincount(arrays["reviews_accepted_id"], minlength=len(self.researchers)).tolist()
+        yearly_generations = np.bincount(arrays["papers_generated_id"], minlength=len(self.researchers)).tolist()
+        for researcher, reviews, generations in zip(self.researchers.values(), yearly_reviews, yearly_generations):
+            researcher.yearly_reviews = reviews
+            researcher.yearly_generations = generations
 
     def tokens_needed_to_submit(self):
         if self.no_tokens_to_submit:
@@ -257,24 +632,51 @@ class JournalModel(Model):
             return self.global_step-self.num_days_with_no_tokens_needed > 0
 
 
+    def maintenance(self):
+        # prune the model-level windowed state once per step, before any agent acts
+        self.trace.step = self.global_step
+        self.moving_average_rev_time.advance(self.global_step)
+        self.moving_average_inv_per_pap.advance(self.global_step)
+        self.expire_yearly_counts(self.global_step - 366)
+
+    def expire_yearly_counts(self, step):
+        # reviews accepted and papers generated at the given step exit the 365-day window
+        for rid in self.reviews_accepted_per_step.pop(step, []):
+            self.researchers[rid].yearly_reviews -= 1
+        for rid in self.papers_generated_per_step.pop(step, []):
+            self.researchers[rid].yearly_generations -= 1
+
+    def researchers_actions(self):
+        # Only researchers with an event today, that need to earn tokens or whose status just changed have something to do
+        active = self.calendar.pop(self.global_step, set())
+        active |= self.researchers_needing_reviews
+        active |= self.researchers_changing_status
+        self.researchers_changing_status = set()
+        for rid in sorted(active):
+            self.researchers[rid].step()
+
     def agent_actions(self, agent):
 
         # CREATE A NEW PAPER
-        n = random.random()
-        if n < self.daily_submission_prob:
+        if agent.next_paper_step == self.global_step:
             new_paper = Paper(
                 ID=self.next_paper_id,
                 generation_step=self.global_step,
                 submission_step=None,
                 author_id=agent.unique_id,
-                num_reviews=self.coin_toss({2: self.prob_2_reviews, 3: 1.0}),
+                num_reviews=self.num_reviews_sampler.sample(self.random_generation),
             )
             self.next_paper_id += 1
             # self.papers_generated_in_step += 1
             agent.papers_to_submit.append(new_paper)
-            self.verboseLog(f'Agent {agent.unique_id} wrote a new paper ({n}<{self.daily_submission_prob}) with {new_paper.num_reviews} reviews needed; now has {len(agent.papers_to_submit)} papers to submit')
+            agent.yearly_generations += 1
+            self.papers_generated_per_step.setdefault(self.global_step, []).append(agent.unique_id)
+            self.schedule_paper_generation(agent)
+            if __debug__ and self.trace.generation:
+                self.trace.log("generation", 'Agent %s wrote a new paper with %s reviews needed; now has %s papers to submit; next paper at step %s', agent.unique_id, new_paper.num_reviews, len(agent.papers_to_submit), agent.next_paper_step)
         else:
-            self.verboseLog(f'Agent {agent.unique_id} did not write a new paper ({n}>={self.daily_submission_prob})')
+            if __debug__ and self.trace.generation:
+                self.trace.log("generation", 'Agent %s did not write a new paper (next paper at step %s)', agent.unique_id, agent.next_paper_step)
 
         # DO REVIEWS AND EARN TOKENS
         reviews_done = []
@@ -284,79 +686,110 @@ class JournalModel(Model):
                 if paper:
                     for j, (rid, done) in enumerate(paper.reviewers):
                         if rid == agent.unique_id:
+                            if done == -1:
+                                paper.num_reviews_done += 1
                             paper.reviewers[j] = (agent.unique_id, self.global_step)
                             if self.tokens_needed_to_submit():
                                 agent.num_tokens += 1
-                            self.verboseLog(f'Agent {agent.unique_id} reviewed paper {paper_id} and now has {agent.num_tokens} tokens')
+                            if __debug__ and self.trace.review:
+                                self.trace.log("review", 'Agent %s reviewed paper %s and now has %s tokens', agent.unique_id, paper_id, agent.num_tokens)
 
-                            self.moving_average_rev_time_dict[self.global_step] = (self.moving_average_rev_time_dict[self.global_step][0] + 1, self.moving_average_rev_time_dict[self.global_step][1] + (self.global_step - accepted_step))
+                            self.moving_average_rev_time.add(1, self.global_step - accepted_step)
                         else:
-                            self.verboseLog(f'ERROR - Agent {agent.unique_id} was supposed to review paper {paper_id} but agent''s id was not found in the list of reviewers {paper.reviewers}')
+                            if __debug__ and self.trace.review:
+                                self.trace.log("review", "ERROR - Agent %s was supposed to review paper %s but agent's id was not found in the list of reviewers %s", agent.unique_id, paper_id, list(paper.reviewers))
+                    self.check_paper_reviewed(paper)
                 else:
-                    self.verboseLog(f'ERROR - Agent {agent.unique_id} was supposed to review paper {paper_id} but paper''s id was not found in the global list of submitted papers')
+                    if __debug__ and self.trace.review:
+                        self.trace.log("review", "ERROR - Agent %s was supposed to review paper %s but paper's id was not found in the global list of submitted papers", agent.unique_id, paper_id)
                 reviews_done.append((paper_id, scheduled_step, done_by_status, accepted_step))
             elif scheduled_step > self.global_step:
-                self.verboseLog(f'Agent {agent.unique_id} has not yet reviewed paper {paper_id} (scheduled for step {scheduled_step}; current is {self.global_step})')
+                if __debug__ and self.trace.review:
+                    self.trace.log("review", 'Agent %s has not yet reviewed paper %s (scheduled for step %s; current is %s)', agent.unique_id, paper_id, scheduled_step, self.global_step)
         for rev in reviews_done: 
-            agent.reviews_done.append(rev)
             agent.papers_to_review.remove(rev)
 
         # SUBMIT PAPERS AND SPEND TOKENS
         papers_ready = []
         for paper in agent.papers_to_submit:
             if not self.tokens_needed_to_submit():
-                paper.submission_step = self.global_step
-                self.submitted_papers.append(paper)
-                self.submitted_papers_dict[paper.ID] = paper
+                self.submit_paper(paper)
                 papers_ready.append(paper)
-                self.verboseLog(f'Agent {agent.unique_id} submitted paper {paper.ID} spending {paper.num_reviews} tokens and now has {agent.num_tokens} tokens')
+                if __debug__ and self.trace.submission:
+                    self.trace.log("submission", 'Agent %s submitted paper %s spending %s tokens and now has %s tokens', agent.unique_id, paper.ID, paper.num_reviews, agent.num_tokens)
             else:
                 if paper.num_reviews <= agent.num_tokens:
-                    paper.submission_step = self.global_step
-                    self.submitted_papers.append(paper)
+                    self.submit_paper(paper)
                     agent.num_tokens -= paper.num_reviews
-                    self.submitted_papers_dict[paper.ID] = paper
                     papers_ready.append(paper)
-                    self.verboseLog(f'Agent {agent.unique_id} submitted paper {paper.ID} spending {paper.num_reviews} tokens and now has {agent.num_tokens} tokens')
+                    if __debug__ and self.trace.submission:
+                        self.trace.log("submission", 'Agent %s submitted paper %s spending %s tokens and now has %s tokens', agent.unique_id, paper.ID, paper.num_reviews, agent.num_tokens)
                 else:
-                    self.verboseLog(f'Agent {agent.unique_id} has not enough tokens to submit paper {paper.ID} ({agent.num_tokens} available tokens < {paper.num_reviews} required tokens)')
+                    if __debug__ and self.trace.submission:
+                        self.trace.log("submission", 'Agent %s has not enough tokens to submit paper %s (%s available tokens < %s required tokens)', agent.unique_id, paper.ID, agent.num_tokens, paper.num_reviews)
         for paper in papers_ready:
             agent.papers_to_submit.remove(paper)
-            agent.papers_submitted.append(paper)
 
         # UPDATE LAZY/EAGER STATUS
         agent.prev_status = agent.status
-        agent.became_eager = False
 
         if self.author_needs_reviews_to_publish(agent):
             rev_ant = 0
             
-            self.verboseLog(f'Agent {agent.unique_id} has {len(agent.papers_to_submit)} papers to submit, with {self.get_author_tokens_to_submit(agent)} tokens needed, but has only {agent.num_tokens} tokens')
+            if __debug__ and self.trace.status:
+                self.trace.log("status", 'Agent %s has %s papers to submit, with %s tokens needed, but has only %s tokens', agent.unique_id, len(agent.papers_to_submit), self.get_author_tokens_to_submit(agent), agent.num_tokens)
             token_needed = self.get_author_tokens_to_submit(agent) - agent.num_tokens
             for idx, (paper_id, scheduled_step, done_by_status, accepted_step) in enumerate(agent.papers_to_review):
                 if token_needed <= 0:
                     break
-                agent.became_eager = True
-                #add jitter to the review time of up to 10 days
-                new_review_time = self.global_step + self.coin_toss(self.review_time[agent.status]) + random.randint(0, 10)
+                new_review_time = self.global_step + self.review_time_sampler[agent.status].sample(self.random_review_times)
                 if scheduled_step > new_review_time:
-                    agent.papers_to_review[idx] = (paper_id, new_review_time, "E", accepted_step)
+                    agent.papers_to_review[idx] = (paper_id, new_review_time, EAGER, accepted_step)
+                    self.schedule(agent, new_review_time)
                     token_needed -= 1
-                    self.verboseLog(f'Agent {agent.unique_id} updated review time for paper {paper_id} to {new_review_time} because needs reviews to publish')
+                    if __debug__ and self.trace.status:
+                        self.trace.log("status", 'Agent %s updated review time for paper %s to %s because needs reviews to publish', agent.unique_id, paper_id, new_review_time)
                     rev_ant += 1
                 else:
-                    agent.papers_to_review[idx] = (paper_id, scheduled_step, "E", accepted_step)
-                    self.verboseLog(f'Agent {agent.unique_id} did not update review time for paper {paper_id} because it is already scheduled in {scheduled_step-self.global_step} days')
+                    agent.papers_to_review[idx] = (paper_id, scheduled_step, EAGER, accepted_step)
+                    if __debug__ and self.trace.status:
+                        self.trace.log("status", 'Agent %s did not update review time for paper %s because it is already scheduled in %s days', agent.unique_id, paper_id, scheduled_step-self.global_step)
             if token_needed > 0:
-                agent.status = "E"
-                self.verboseLog(f'Agent {agent.unique_id} is EAGER because still needs {token_needed} papers to submit and has no assigned review for it')              
+                self.set_status(agent, EAGER)
+                if __debug__ and self.trace.status:
+                    self.trace.log("status", 'Agent %s is EAGER because still needs %s papers to submit and has no assigned review for it', agent.unique_id, token_needed)
 
         else:
-            agent.status = "L"
-            self.verboseLog(f'Agent {agent.unique_id} is LAZY because has {len(agent.papers_to_submit)} papers to submit, with {self.get_author_tokens_to_submit(agent)} tokens needed, has {agent.num_tokens} tokens and {len(agent.papers_to_review)} papers planned to review')
+            self.set_status(agent, LAZY)
+            if __debug__ and self.trace.status:
+                self.trace.log("status", 'Agent %s is LAZY because has %s papers to submit, with %s tokens needed, has %s tokens and %s papers planned to review', agent.unique_id, len(agent.papers_to_submit), self.get_author_tokens_to_submit(agent), agent.num_tokens, len(agent.papers_to_review))
 
-        self.clear_researcher_papers(agent)
-        self.moving_average_rev_time_dict = {k: v for k, v in self.moving_average_rev_time_dict.items() if k >= self.global_step - 366}
+        if self.author_needs_reviews_to_publish(agent):
+            self.researchers_needing_reviews.add(agent.unique_id)
+        else:
+            self.researchers_needing_reviews.discard(agent.unique_id)
+        if agent.status != agent.prev_status:
+            self.researchers_changing_status.add(agent.unique_id)
+
+    def submit_paper(self, paper):
+        paper.submission_step = self.global_step
+        self.submitted_papers_dict[paper.ID] = paper
+        self.papers_waiting_reviewers[paper.ID] = paper
+
+    def check_paper_reviewed(self, paper):
+        # the paper leaves the PMS once all its reviewers have done their reviews
+        if paper.num_reviews_done == paper.num_reviews and paper.ID in self.papers_in_review:
+            del self.papers_in_review[paper.ID]
+            del self.submitted_papers_dict[paper.ID]
+            if __debug__ and self.trace.invites:
+                self.trace.log("invites", 'Paper %s was reviewed and removed from the submitted papers list', paper.ID)
+
+    def set_status(self, agent, status):
+        agent.status = status
+        if status == EAGER:
+            self.eager_researchers.add(agent.unique_id)
+        else:
+            self.eager_researchers.discard(agent.unique_id)
 
     def get_author_tokens_to_submit(self,author):
         if not self.tokens_needed_to_submit():
@@ -375,75 +808,123 @@ class JournalModel(Model):
     def author_needs_reviews_to_publish(self,author):
         return self.get_author_tokens_to_submit(author) - author.num_tokens > 0
     
-    def clear_researcher_papers(self, author, back=365):
-        author.reviews_done = [rev for rev in author.reviews_done if rev[3] >= self.global_step - back]  # keep only reviews done in the last 365 days
-        author.papers_submitted = [paper for paper in author.papers_submitted if paper.generation_step >= self.global_step - back]  # keep only papers submitted in the last 365 days
-    
-    def get_reviewers_reviews_in_timeframe(self, author, back=365, forward=0):
-        return sum([1 for paper_id, scheduled_step, done_by_status, accepted_step in author.papers_to_review if accepted_step >= self.global_step - back]) \
-                + sum([1 for paper_id, scheduled_step, done_by_status, accepted_step in author.reviews_done if accepted_step >= self.global_step - back])
+    def get_reviewers_reviews_in_timeframe(self, author):
+        return author.yearly_reviews  # reviews accepted in the last 365 days
     
-    def get_authors_generations_in_timeframe(self, author, back=365, forward=0):
-        return sum([1 for paper in author.papers_submitted if paper.generation_step >= self.global_step - back]) \
-                + sum([1 for paper in author.papers_to_submit if paper.generation_step >= self.global_step - back])
+    def get_authors_generations_in_timeframe(self, author):
+        return author.yearly_generations  # papers generated in the last 365 days
     
     def reviewer_can_review(self,author):
-        return author.max_yearly_reviews==0 or author.status=="E" or self.get_reviewers_reviews_in_timeframe(author)<author.max_yearly_reviews # per author check
+        return author.max_yearly_reviews==0 or author.status==EAGER or self.get_reviewers_reviews_in_timeframe(author)<author.max_yearly_reviews # per author check
     
+    def draw_invitations(self):
+        # The invitations of the day, drawn at once for all the papers waiting for reviewers. Each missing
+        # review gets up to num_invites_per_review invitations, each sent with probability 1/7 (to model
+        # the fact that the reviewer takes some time to answer the invitation) and none after the first
+        # one not sent; the invitations after the one accepted are skipped by invite_reviewers().
+        # Returns the papers and, for every invitation, the index of its paper and of its review (among
+        # the reviews with invitations), and the uniform draws picking the reviewer and deciding whether
+        # they accept.
+        papers = list(self.papers_waiting_reviewers.values())  # in order of submission
+        while papers and papers[-1].submission_step > self.global_step + 4: # adding 4 days of delay to begin inviting
+            papers.pop()
+        needed = (np.fromiter(map(attrgetter("num_reviews"), papers), dtype=np.int64, count=len(papers))
+                  - np.fromiter(map(len, map(attrgetter("reviewers"), papers)), dtype=np.int64, count=len(papers)))
+        num_invites = np.minimum(self.rng_invitations.geometric(6/7, size=int(needed.sum())) - 1, self.num_invites_per_review)
+        invited = num_invites > 0
+        invite_paper = np.repeat(np.repeat(np.arange(len(papers)), needed)[invited], num_invites[invited])
+        invite_review = np.repeat(np.arange(np.count_nonzero(invited)), num_invites[invited])
+        pick, accept = self.rng_invitations.random((2, len(invite_review)))
+        if __debug__ and self.trace.invites:
+            for paper in papers:
+                self.trace.log("invites", 'Paper %s needs %s reviews but has only %s reviewers; inviting more reviewers', paper.ID, paper.num_reviews, len(paper.reviewers))
+        return papers, invite_paper, invite_review, pick, accept
+
+    def invite_reviewers(self, eager_researchers):
+        # Sends the invitations of the day, picking the reviewers among `eager_researchers` while there
+        # are any, and among all the researchers afterwards; returns the number of invitations sent.
+        # accepts_invitation() and add_reviewer() are the engine's side of each invitation.
+        papers, invite_paper, invite_review, pick, accept = self.draw_invitations()
+        num_invitations = len(invite_review)
+        paper_index, review_index, accepts = invite_paper.tolist(), invite_review.tolist(), accept.tolist()
+        accepted_at = np.full(review_index[-1] + 1 if review_index else 0, num_invitations)  # the invitation accepted for each review
+        assigned_review = -1  # the invitations of a review are consecutive, and stop once one is accepted
+
+        # Priority to eager reviewers, one invitation at a time since every acceptance may change who is eager
+        first_lazy = num_invitations
+        for i, (review, pick_draw) in enumerate(zip(review_index, pick.tolist())):
+            if len(eager_researchers) == 0:
+                first_lazy = i
+                break
+            if review == assigned_review:
+                continue
+            paper = papers[paper_index[i]]
+            reviewer = eager_researchers[int(pick_draw * len(eager_researchers))]
+            if self.accepts_invitation(paper, reviewer, accepts[i]):
+                assigned_review = review
+                accepted_at[review] = i
+                self.add_reviewer(paper, reviewer, eager_researchers)
+
+        # Then any researcher, who is lazy: invitations failing the lazy reviewers' coin toss are refused
+        # whatever the state of the reviewer, so only the others are sent one at a time
+        maybe_accepted = np.flatnonzero(accept[first_lazy:] <= self.prob_accept_review_invitation[LAZY]) + first_lazy
+        for i, pick_draw in zip(maybe_accepted.tolist(), pick[maybe_accepted].tolist()):
+            review = review_index[i]
+            if review == assigned_review:
+                continue
+            paper = papers[paper_index[i]]
+            reviewer = self.pick_researcher(pick_draw)
+            if self.accepts_invitation(paper, reviewer, accepts[i]):
+                assigned_review = review
+                accepted_at[review] = i
+                self.add_reviewer(paper, reviewer, eager_researchers)
+
+        sent = np.arange(num_invitations) <= accepted_at[invite_review]
+        if sent[first_lazy:].any():
+            self.inviting_lazy_in_step = True
+        if __debug__ and self.trace.invites:
+            refused = np.flatnonzero(sent[first_lazy:] & (accept[first_lazy:] > self.prob_accept_review_invitation[LAZY])) + first_lazy
+            for i, pick_draw in zip(refused.tolist(), pick[refused].tolist()):
+                self.trace.log("invites", 'Paper %s invited reviewer %s who refused to review it (reviewer is %s)', papers[paper_index[i]].ID, self.pick_researcher(pick_draw), STATUS_NAMES[LAZY])
+
+        invites_per_paper = np.bincount(invite_paper[sent], minlength=len(papers))
+        for i in np.flatnonzero(invites_per_paper).tolist():
+            paper = papers[i]
+            paper.num_invites += int(invites_per_paper[i])
+            if paper.num_reviews == len(paper.reviewers): # enough reviewers invited, collect stat
+                self.moving_average_inv_per_pap.add(1, paper.num_invites)
+                del self.papers_waiting_reviewers[paper.ID]
+                self.papers_in_review[paper.ID] = paper
+        return int(np.count_nonzero(sent))
+
+    def pick_researcher(self, draw):
+        # the researcher invited when no one is eager, for a uniform draw in [0, 1)
+        return int(draw * self.num_authors)
+
+    def accepts_invitation(self, paper, rid, accept):
+        reviewer = self.researchers.get(rid)
+        if reviewer and self.reviewer_can_review(reviewer) and accept <= self.prob_accept_review_invitation[reviewer.status]:
+            return True
+        if __debug__ and self.trace.invites:
+            self.trace.log("invites", 'Paper %s invited reviewer %s who refused to review it (reviewer is %s)', paper.ID, rid, STATUS_NAMES[reviewer.status])
+        return False
+
+    def add_reviewer(self, paper, rid, eager_researchers):
+        reviewer = self.researchers[rid]
+        review_iter = self.review_time_sampler[reviewer.status].sample(self.random_review_times)
+        reviewer.papers_to_review.append((paper.ID, self.global_step + review_iter, reviewer.status, self.global_step))
+        self.schedule(reviewer, self.global_step + review_iter)
+        reviewer.yearly_reviews += 1
+        self.reviews_accepted_per_step.setdefault(self.global_step, []).append(reviewer.unique_id)
+        paper.reviewers.append((reviewer.unique_id, -1))
+        # reviewer.max_reviews -= 1
+        if __debug__ and self.trace.invites:
+            self.trace.log("invites", 'Paper %s invited reviewer %s who agreed to review it and will do so in %s days (reviewer is %s)', paper.ID, reviewer.unique_id, review_iter, STATUS_NAMES[reviewer.status])
+
+        if reviewer.status == EAGER and self.author_needs_reviews_to_publish(reviewer):
+            self.set_status(reviewer, LAZY)  # also leaves eager_researchers
+            if __debug__ and self.trace.status:
+                self.trace.log("status", 'Agent %s changed status from EAGER to LAZY because has enough reviews', reviewer.unique_id)
+
     def assign_reviews(self):
-        # Get eager reviewer to give them priority
-        eager_researchers = [researcher for researcher in self.researchers.values() if researcher.status=="E"]
-
-        for paper in self.submitted_papers[:]:
-            if len(paper.reviewers) < paper.num_reviews and paper.submission_step <= self.global_step + 4: # adding 4 days of delay to begin inviting
-                self.verboseLog(f'Paper {paper.ID} needs {paper.num_reviews} reviews but has only {len(paper.reviewers)} reviewers; inviting more reviewers')
-                needed = paper.num_reviews - len(paper.reviewers)
-                for _ in range(needed):
-                    invites = 0
-                    while invites < self.num_invites_per_review:
-                        # Probability to invite: used to model the fact that the reviewer takes some time to answer the invitation
-                        if(random.random() >= 1/7):
-                            break
-                        invites += 1
-                        paper.num_invites += 1
-                        # Priority to eager reviewers
-                        if len(eager_researchers)>0:
-                            erid = random.randint(0, len(eager_researchers) - 1)
-                            reviewer = self.researchers.get(eager_researchers[erid].unique_id)
-                        else:
-                            self.inviting_lazy_in_step = True
-                            rid = random.randint(0, self.num_authors - 1)
-                            reviewer = self.researchers.get(rid)
-                        # Invite
-                        if reviewer and self.reviewer_can_review(reviewer) and random.random() <= self.prob_accept_review_invitation[reviewer.status]:
-                            #add jitter to the review time of up to 10 days
-                            review_iter = self.coin_toss(self.review_time[reviewer.status]) + random.randint(0, 10)
-                            reviewer.papers_to_review.append((paper.ID, self.global_step + review_iter, reviewer.status, self.global_step))
-                            paper.reviewers.append((reviewer.unique_id, -1))
-                            # reviewer.max_reviews -= 1
-                            self.verboseLog(f'Paper {paper.ID} invited reviewer {reviewer.unique_id} who agreed to review it and will do so in {review_iter} days (reviewer is {reviewer.status})')
-                            
-                            if paper.num_reviews == len(paper.reviewers): # enough reviewers invited, collect stat
-                                self.moving_average_inv_per_pap_dict[self.global_step] = (self.moving_average_inv_per_pap_dict[self.global_step][0] + 1, self.moving_average_inv_per_pap_dict[self.global_step][1] + paper.num_invites)
-
-                            if reviewer.status == "E" and self.author_needs_reviews_to_publish(reviewer):
-                                reviewer.status = "L"
-                                self.verboseLog(f'Agent {reviewer.unique_id} changed status from EAGER to LAZY because has enough reviews')
-                                # Remove eager reviewer from the list
-                                eager_researchers.remove(reviewer)
-                            break
-                        else:
-                            self.verboseLog(f'Paper {paper.ID} invited reviewer {reviewer.unique_id} who refused to review it (reviewer is {reviewer.status})')
-            else:
-                # check if all reviewers have done their reviews
-                all_done = True
-                for rid, done in paper.reviewers:
-                    if done == -1:
-                        all_done = False
-                        break
-                if all_done:
-                    self.submitted_papers.remove(paper)
-                    del self.submitted_papers_dict[paper.ID] 
-                    self.verboseLog(f'Paper {paper.ID} was reviewed and removed from the submitted papers list')
-                else:
-                    self.verboseLog(f'Paper {paper.ID} is awaiting reviews')
\ No newline at end of file
+        self.invites_sent_in_step = self.invite_reviewers(self.eager_researchers)
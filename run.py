@@ -0,0 +1,104 @@
+# run.py
+#
+# Headless batch runner: simulates a number of days at full speed, without the web interface, e.g.:
+#   python run.py --days 3650 --output-dir runs/baseline --initial-tokens 3 --prob-accept-L 0.2
+# Every parameter of JournalModel is available as an option (python run.py --help).
+# Scenarios can share a warm-up, saved once and then continued with different parameters:
+#   python run.py --days 365 --output-dir runs/warmup --save-checkpoint runs/warmup-365
+#   python run.py --days 3650 --output-dir runs/tokens-2 --checkpoint runs/warmup-365 --initial-tokens 2
+
+import argparse
+import inspect
+import resource
+import sys
+import time
+from model import JournalModel
+from vectorized import VectorizedJournalModel
+from cohort import CohortJournalModel
+from journals import MultiJournalModel, parse_journals
+from tracing import CATEGORIES
+from checkpoint import read_checkpoint
+
+ENGINES = {"agents": JournalModel, "vectorized": VectorizedJournalModel, "cohort": CohortJournalModel, "journals": MultiJournalModel}
+
+
+def parse_bool(value):
+    if value.lower() in ("yes", "true", "1"):
+        return True
+    if value.lower() in ("no", "false", "0"):
+        return False
+    raise argparse.ArgumentTypeError(f"{value} is not a boolean (use yes/no)")
+
+
+def add_model_arguments(parser, skip=()):
+    # one option per parameter of JournalModel, typed after its default value
+    for name, param in inspect.signature(JournalModel.__init__).parameters.items():
+        if name == "self" or name in skip or param.default is None:
+            continue
+        option = "--" + name.replace("_", "-")
+        if isinstance(param.default, bool):
+            parser.add_argument(option, dest=name, type=parse_bool, default=param.default, metavar="yes|no")
+        elif isinstance(param.default, tuple):
+            parser.add_argument(option, dest=name, nargs="*", choices=CATEGORIES, default=param.default)
+        else:
+            parser.add_argument(option, dest=name, type=type(param.default), default=param.default)
+
+
+def model_arguments(args):
+    return {name: getattr(args, name) for name in inspect.signature(JournalModel.__init__).parameters if hasattr(args, name)}
+
+
+def apply_checkpoint_defaults(parser, path):
+    # the engine and parameters of the checkpointed run, unless given on the command line
+    arrays, state = read_checkpoint(path)
+    engine = next(name for name, cls in ENGINES.items() if cls.__name__ == state["engine"])
+    parser.set_defaults(engine=engine, **state["params"])
+
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KiB on Linux
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the token-based peer-review simulation without the web interface")
+    parser.add_argument("--engine", choices=ENGINES.keys(), default="agents")
+    parser.add_argument("--days", type=int, required=True, help="number of simulated days")
+    parser.add_argument("--seed", type=int, help="seed of the random streams (default: a fresh one, recorded in the log file)")
+    parser.add_argument("--checkpoint", help="continue the run saved in this checkpoint; its parameters are the defaults")
+    parser.add_argument("--save-checkpoint", metavar="PATH", help="save a checkpoint at the end of the run")
+    parser.add_argument("--journals", type=parse_journals, metavar="SHARE:PROB_2_REVIEWS:INVITES_PER_REVIEW,...",
+                        help="journals of the journals engine (default: one journal with --prob-2-reviews and --num-invites-per-review)")
+    parser.add_argument("--processes", type=int, help="worker processes of the journals engine (default: one per journal, up to the number of cores)")
+    add_model_arguments(parser, skip=("horizon",))
+    args = parser.parse_args()
+    if args.checkpoint:
+        apply_checkpoint_defaults(parser, args.checkpoint)
+        args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine_arguments = dict(journals=args.journals, processes=args.processes) if args.engine == "journals" else {}
+    model = ENGINES[args.engine](horizon=args.days, **model_arguments(args), **engine_arguments)
+    build_time = time.perf_counter() - start
+
+    start, first_step = time.perf_counter(), model.global_step
+    try:
+        while model.running and model.global_step < args.days:
+            model.step()
+        run_time = time.perf_counter() - start
+    finally:
+        model.close()
+    if args.save_checkpoint:
+        model.save_checkpoint(args.save_checkpoint)
+
+    print(f"{args.engine} engine, {args.num_authors} researchers, {model.global_step} days; seed {model.seed}; output in {model.metrics_fname}")
+    print(f"wall time: {build_time + run_time:.1f} s ({'restore' if args.checkpoint else 'build'} {build_time:.1f} s, run {run_time:.1f} s), "
+          f"{(model.global_step - first_step) / max(run_time, 1e-9):.2f} steps/s, peak RSS {peak_rss_mib():.0f} MiB")
+    if model.stop_reason:
+        print(f"stopped early: {model.stop_reason}")
+    if model.instrumentation:
+        print(model.instrumentation_summary())
+
+
+if __name__ == "__main__":
+    main()
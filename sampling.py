@@ -0,0 +1,43 @@
+# sampling.py
+
+import bisect
+import random
+import numpy as np
+
+
+class DiscreteSampler:
+    """Inverse-CDF sampler of a distribution given as {value: cumulative probability}.
+
+    Draws the same values as coin_toss in benchmark.py, the linear scan JournalModel used before (the
+    smallest value whose cumulative probability is not lower than a uniform draw, or the largest
+    value if there is none), but the distribution is compiled once into sorted arrays and every
+    draw is a binary search.
+    If jitter > 0, a uniform integer between 0 and jitter (both included) is added to each draw.
+    """
+
+    def __init__(self, distribution, jitter=0):
+        items = sorted(distribution.items())
+        self.values = [k for k, v in items]
+        # running maximum, so that bisecting finds the first value whose probability is not lower than the draw
+        self.cumulative = []
+        for k, v in items:
+            self.cumulative.append(max(v, self.cumulative[-1]) if self.cumulative else v)
+        self.max_value = max(self.values)
+        self.jitter = jitter
+        self.np_values = np.array(self.values + [self.max_value])
+        self.np_cumulative = np.array(self.cumulative, dtype=np.float64)
+
+    def sample(self, rng=random):
+        # one draw using a random.Random-like generator
+        i = bisect.bisect_left(self.cumulative, rng.random())
+        value = self.values[i] if i < len(self.values) else self.max_value
+        if self.jitter:
+            value += rng.randint(0, self.jitter)
+        return value
+
+    def sample_many(self, n, rng):
+        # n draws at once using a numpy.random.Generator
+        values = self.np_values[np.searchsorted(self.np_cumulative, rng.random(n), side="left")]
+        if self.jitter:
+            values = values + rng.integers(0, self.jitter + 1, size=n)
+        return values
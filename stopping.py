@@ -0,0 +1,59 @@
+# stopping.py
+
+import numpy as np
+
+# metrics whose trajectory decides whether a run has settled or diverged
+STOPPING_COLUMNS = ("Submitted", "Submitted waiting reviewers", "Avg reviewing time 1m")
+
+
+class StoppingRule:
+    """Decides from the metrics recorded so far whether a run has reached a steady state or diverged.
+
+    Every `check_every` days, the last `window` days of each of `columns` are compared, as long as
+    they all come after `start_step` (e.g. the day tokens are needed, when the regime changes).
+    A series is steady if its linear trend drifts by less than `tolerance` of its level over the
+    window, the means of the two halves of the window differ by less than `tolerance` of it, and
+    their variances by less than a factor `variance_ratio`; the run is settled when every series
+    is steady. A series diverges if its trend grows by more than `divergence` times its level
+    over the window without slowing down (the second half grows at least half as fast as the
+    first); the run diverges as soon as any series does.
+    The thresholds are on the size of the changes rather than on their significance, because the
+    values of consecutive days (and the 30-day averages even more) are strongly correlated.
+    """
+
+    def __init__(self, window=365, tolerance=0.05, variance_ratio=4.0, divergence=1.0, columns=STOPPING_COLUMNS, check_every=30):
+        self.window = window
+        self.tolerance = tolerance
+        self.variance_ratio = variance_ratio
+        self.divergence = divergence
+        self.columns = tuple(columns)
+        self.check_every = check_every
+
+    def check(self, metrics, start_step=0):
+        # returns why the run should stop, or None; `metrics` is the MetricsStore of the run
+        steps = metrics.column("Step")
+        step = int(steps[-1])
+        if step - self.window < start_step or step % self.check_every != 0 or len(steps) <= self.window:
+            return None
+        steady = []
+        for name in self.columns:
+            values = metrics.column(name)[-self.window:].astype(np.float64)
+            first, second = np.array_split(values, 2)
+            level = max(abs(values.mean()), 1.0)  # queues may be (almost) empty
+            drift = trend(values) * len(values)
+            growth = (trend(first), trend(second))
+            if drift > self.divergence * max(abs(first.mean()), 1.0) and growth[1] >= 0.5 * growth[0] > 0:
+                return f"diverged at day {step}: {name} grew from {first.mean():.1f} to {second.mean():.1f} in {self.window} days"
+            floor = (0.01 * level) ** 2  # variances negligible with respect to the level are equal
+            variances = sorted((first.var() + floor, second.var() + floor))
+            steady.append(abs(drift) < self.tolerance * level and abs(second.mean() - first.mean()) < self.tolerance * level
+                          and variances[1] < self.variance_ratio * variances[0])
+        if all(steady):
+            return f"steady state at day {step}: " + ", ".join(f"{name} {metrics.column(name)[-self.window:].mean():.1f}" for name in self.columns)
+        return None
+
+
+def trend(values):
+    # least-squares slope of the values of consecutive days
+    days = np.arange(len(values)) - (len(values) - 1) / 2
+    return float(days @ (values - values.mean()) / (days @ days))
@@ -0,0 +1,293 @@
+# sweep.py
+#
+# Parameter sweeps and replicate ensembles over a process pool, e.g.:
+#   python sweep.py --days 1825 --replicates 20 --output sweeps/tokens \
+#       --grid initial_tokens=1,2,3 --grid prob_accept_L=0.1,0.2 --set num_authors=135972
+# Runs are streamed into <output>/results.csv as they complete; re-running the same command
+# resumes the sweep, skipping the runs already completed. With --checkpoint, every run continues
+# a saved warm-up (see checkpoint.py) with its own parameters and seed.
+
+import argparse
+import csv
+import inspect
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from model import JournalModel
+from metrics import FORMATS
+from checkpoint import read_checkpoint
+from ensemble import EnsembleStats
+from run import ENGINES, parse_bool
+
+ENSEMBLE_SAVE_INTERVAL = 60  # seconds between the saves of the ensemble statistics of a sweep
+SUBMITTED_PER_WORKER = 2  # runs submitted to the pool at a time, per worker process
+
+
+def make_runs(grid, replicates, seed=0, fixed=None):
+    # one run per combination of the grid values and replicate, each with its own seed
+    names = list(grid.keys())
+    combinations = list(itertools.product(*(grid[name] for name in names)))
+    seeds = np.random.SeedSequence(seed).spawn(len(combinations) * replicates)
+    runs = []
+    for values in combinations:
+        for replicate in range(replicates):
+            run_id = len(runs)
+            params = dict(fixed or {})
+            params.update(zip(names, values))
+            runs.append({"run_id": run_id, "replicate": replicate, "seed": int(seeds[run_id].generate_state(1)[0]), "params": params})
+    return runs
+
+
+def simulate(run, days, engine, output_dir, output_format="none"):
+    # runs in a worker process; returns the metrics of every step, including the initial state, as a
+    # structured array (one field per column), and why the run stopped before `days` days (with
+    # stop_early), if it did
+    model = ENGINES[engine](output_dir=os.path.join(output_dir, "runs", f"run-{run['run_id']:06d}"), output_format=output_format,
+                            horizon=days, seed=run["seed"], **run["params"])
+    try:
+        while model.running and model.global_step < days:
+            model.step()
+    finally:
+        model.close()
+    return model.metrics.data[:model.metrics.num_rows], model.stop_reason
+
+
+def completed_runs(output_dir):
+    path = os.path.join(output_dir, "completed.txt")
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {int(line) for line in f if line.strip()}
+
+
+def drop_incomplete_rows(results_path, completed):
+    # a sweep interrupted while appending a run leaves rows of runs not marked as completed
+    if not os.path.exists(results_path):
+        return
+    with open(results_path, newline="") as f:
+        rows = list(csv.reader(f))
+    with open(results_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerows(rows[:1] + [row for row in rows[1:] if len(row) == len(rows[0]) and int(row[0]) in completed])
+
+
+def ensemble_path(output_dir, combination):
+    return os.path.join(output_dir, f"ensemble-{combination:04d}.npz")
+
+
+def load_ensembles(output_dir, runs, replicates):
+    # the ensemble statistics of every combination of the grid values, and the runs they include, each
+    # with the step it stopped at and why (-1 and "" if it did not stop early)
+    ensembles, ensemble_runs = dict(), dict()
+    for combination in range(len(runs) // replicates):
+        path = ensemble_path(output_dir, combination)
+        if os.path.exists(path):
+            ensembles[combination], extra = EnsembleStats.load(path)
+            run_ids = extra["run_ids"].tolist()
+            stop_steps = extra["stop_steps"].tolist() if "stop_steps" in extra else [-1] * len(run_ids)
+            stop_reasons = extra["stop_reasons"].tolist() if "stop_reasons" in extra else [""] * len(run_ids)
+            ensemble_runs[combination] = dict(zip(run_ids, zip(stop_steps, stop_reasons)))
+    return ensembles, ensemble_runs
+
+
+def save_ensemble(output_dir, combination, stats, stops):
+    # stops maps the ids of the runs included to the step they stopped at and why
+    run_ids = sorted(stops)
+    stats.save(ensemble_path(output_dir, combination), run_ids=np.array(run_ids, dtype=np.int64),
+               stop_steps=np.array([stops[r][0] for r in run_ids], dtype=np.int64), stop_reasons=np.array([stops[r][1] for r in run_ids], dtype=str))
+
+
+def write_ensemble_csv(output_dir, runs, replicates, ensembles, ensemble_runs):
+    # one row per combination and step, with the parameters of the combination; the runs that stopped
+    # early are listed in stopped.csv
+    tables, stopped = [], []
+    for combination, stats in sorted(ensembles.items()):
+        params = runs[combination * replicates]["params"]
+        table = stats.to_dataframe()
+        for name, value in reversed(params.items()):
+            table.insert(0, name, value)
+        tables.append(table)
+        for run_id, (step, reason) in sorted(ensemble_runs[combination].items()):
+            if step >= 0:
+                stopped.append(dict(params, run_id=run_id, replicate=runs[run_id]["replicate"], step=step, reason=reason))
+    if tables:
+        pd.concat(tables).to_csv(os.path.join(output_dir, "ensemble.csv"), index=False)
+    pd.DataFrame(stopped, columns=list(runs[0]["params"]) + ["run_id", "replicate", "step", "reason"]).to_csv(os.path.join(output_dir, "stopped.csv"), index=False)
+
+
+def sweep(grid, replicates, days, output_dir, engine="agents", processes=None, seed=0, fixed=None, run_output_format="none", ensemble=False):
+    """Runs every combination of the grid values `replicates` times, in parallel.
+
+    Results are appended to <output_dir>/results.csv (one row per run and step, with the run
+    parameters) as soon as each run completes; completed runs are listed in completed.txt and
+    are skipped when the sweep is resumed, failed ones are reported in failed.txt (including the
+    runs in progress when a worker process crashes, after which the sweep goes on in a new pool).
+    With ensemble=True, the rows of the runs are not kept: they are added to the statistics of
+    their combination of values (see ensemble.py), saved to <output_dir>/ensemble-NNNN.npz (with
+    the runs included, which are skipped when the sweep is resumed) at most every
+    ENSEMBLE_SAVE_INTERVAL seconds, and written to <output_dir>/ensemble.csv at the end. A run that
+    stopped early (stop_early) contributes its last values to every later step up to `days`,
+    counted in the "Runs stopped" column, and is listed in <output_dir>/stopped.csv with its step
+    and reason.
+    The runs write their own log and metrics files in <output_dir>/runs only if run_output_format
+    is not "none".
+    Returns the number of runs that failed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # run ids and seeds depend on the sweep definition, which must not change when resuming
+    definition = {"grid": grid, "replicates": replicates, "days": days, "engine": engine, "seed": seed, "fixed": fixed or {}}
+    if ensemble:
+        definition["ensemble"] = True
+    definition_path = os.path.join(output_dir, "sweep.json")
+    if os.path.exists(definition_path):
+        with open(definition_path) as f:
+            if json.load(f) != json.loads(json.dumps(definition)):
+                raise ValueError(f"{output_dir} contains a different sweep; use another output directory")
+    else:
+        with open(definition_path, "w") as f:
+            json.dump(definition, f, indent=2)
+    runs = make_runs(grid, replicates, seed, fixed)
+    param_names = list(runs[0]["params"].keys())
+    results_path = os.path.join(output_dir, "results.csv")
+    if ensemble:
+        ensembles, ensemble_runs = load_ensembles(output_dir, runs, replicates)
+        completed = {run_id for stops in ensemble_runs.values() for run_id in stops}
+        unsaved, last_save = set(), time.perf_counter()
+    else:
+        completed = completed_runs(output_dir)
+        drop_incomplete_rows(results_path, completed)
+    pending = [run for run in runs if run["run_id"] not in completed]
+    print(f"{len(runs)} runs, {len(runs) - len(pending)} already completed")
+
+    def save_ensembles():
+        for combination in unsaved:
+            save_ensemble(output_dir, combination, ensembles[combination], ensemble_runs[combination])
+        unsaved.clear()
+
+    failures = 0
+    start = time.perf_counter()
+    workers = processes or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        with open(results_path, "a", newline="") as results_file, \
+                open(os.path.join(output_dir, "completed.txt"), "a") as completed_file, \
+                open(os.path.join(output_dir, "failed.txt"), "a") as failed_file:
+            writer = csv.writer(results_file)
+
+            def record_failure(run, error):
+                nonlocal failures
+                failures += 1
+                failed_file.write(f"{run['run_id']}\t{run['params']}\t{error!r}\n")
+                failed_file.flush()
+
+            # at most SUBMITTED_PER_WORKER runs per worker are submitted at a time, and every run is dropped
+            # once consumed, so that the results of the runs do not accumulate in memory
+            to_submit = iter(pending)
+            futures = dict()
+            while True:
+                for run in itertools.islice(to_submit, SUBMITTED_PER_WORKER * workers - len(futures)):
+                    try:
+                        futures[executor.submit(simulate, run, days, engine, output_dir, run_output_format)] = run
+                    except BrokenProcessPool:
+                        # the pool broke since the last result: it is replaced below, then the run submitted again
+                        to_submit = itertools.chain([run], to_submit)
+                        break
+                if not futures:
+                    break
+                future = next(as_completed(futures))
+                run = futures.pop(future)
+                try:
+                    rows, stop_reason = future.result()
+                except BrokenProcessPool as e:
+                    # a worker process died (e.g. killed for lack of memory) and took the pool down: the runs in
+                    # progress are recorded as failed (a resumed sweep retries them) and the sweep goes on in a new pool
+                    wait(futures)
+                    lost = [run] + [r for f, r in futures.items() if isinstance(f.exception(), BrokenProcessPool)]
+                    futures = {f: r for f, r in futures.items() if not isinstance(f.exception(), BrokenProcessPool)}
+                    for lost_run in lost:
+                        record_failure(lost_run, e)
+                    executor.shutdown()
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                    print(f"a worker process crashed: runs {', '.join(str(r['run_id']) for r in lost)} failed (see failed.txt); continuing")
+                    continue
+                except Exception as e:
+                    record_failure(run, e)
+                    continue
+                if ensemble:
+                    combination = run["run_id"] // replicates
+                    if combination not in ensembles:
+                        ensembles[combination] = EnsembleStats([name for name in rows.dtype.names if name != "Step"], capacity=days + 1)
+                        ensemble_runs[combination] = dict()
+                    ensembles[combination].add_run(rows, until=days)
+                    ensemble_runs[combination][run["run_id"]] = (int(rows["Step"][-1]), stop_reason) if stop_reason else (-1, "")
+                    unsaved.add(combination)
+                    if time.perf_counter() - last_save >= ENSEMBLE_SAVE_INTERVAL:
+                        save_ensembles()
+                        last_save = time.perf_counter()
+                else:
+                    if results_file.tell() == 0:
+                        writer.writerow(["run_id", "replicate", "seed"] + param_names + list(rows.dtype.names))
+                    prefix = [run["run_id"], run["replicate"], run["seed"]] + [run["params"][name] for name in param_names]
+                    writer.writerows(prefix + list(row) for row in rows.tolist())
+                    results_file.flush()
+                    completed_file.write(f"{run['run_id']}\n")
+                    completed_file.flush()
+                completed.add(run["run_id"])
+                print(f"run {run['run_id']} completed ({len(completed)}/{len(runs)}, {time.perf_counter() - start:.0f} s)" + (f"; {stop_reason}" if stop_reason else ""))
+    finally:
+        executor.shutdown()
+    if ensemble:
+        save_ensembles()
+        write_ensemble_csv(output_dir, runs, replicates, ensembles, ensemble_runs)
+    return failures
+
+
+def parse_value(name, value):
+    # values are typed after the default of the JournalModel parameter
+    default = inspect.signature(JournalModel.__init__).parameters[name].default
+    if isinstance(default, bool):
+        return parse_bool(value)
+    return type(default)(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run parameter sweeps of the peer-review simulation over a process pool")
+    parser.add_argument("--engine", choices=ENGINES.keys(), default="agents")
+    parser.add_argument("--days", type=int, required=True, help="number of simulated days of each run")
+    parser.add_argument("--replicates", type=int, default=1, help="number of runs of each combination of values")
+    parser.add_argument("--output", required=True, help="output directory")
+    parser.add_argument("--processes", type=int, help="number of worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0, help="root seed of the runs' random streams")
+    parser.add_argument("--run-output-format", choices=FORMATS + ("none",), default="none", help="format of the metrics files of the single runs")
+    parser.add_argument("--ensemble", action="store_true", help="keep only the mean, variance and quantiles of the runs of each combination of values (ensemble.csv)")
+    parser.add_argument("--checkpoint", help="start every run from this checkpoint, whose engine and parameters are the defaults")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2,...", help="parameter values to sweep")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="parameter value for every run")
+    args = parser.parse_args()
+
+    grid = {}
+    for item in args.grid:
+        name, values = item.split("=", 1)
+        grid[name] = [parse_value(name, value) for value in values.split(",")]
+    fixed = {}
+    engine = args.engine
+    if args.checkpoint:
+        arrays, state = read_checkpoint(args.checkpoint)
+        engine = next(name for name, cls in ENGINES.items() if cls.__name__ == state["engine"])
+        fixed.update(state["params"], checkpoint=args.checkpoint)
+    for item in args.set:
+        name, value = item.split("=", 1)
+        fixed[name] = parse_value(name, value)
+
+    failures = sweep(grid, args.replicates, args.days, args.output, engine, args.processes, args.seed, fixed, args.run_output_format, args.ensemble)
+    if failures:
+        print(f"{failures} runs failed (see failed.txt); run the same command again to retry them")
+
+
+if __name__ == "__main__":
+    main()
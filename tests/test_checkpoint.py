@@ -0,0 +1,46 @@
+import os
+import pandas as pd
+import pytest
+from model import JournalModel
+
+PARAMS = dict(num_authors=300, max_yearly_reviews_per_author_distribution="No", num_days_with_no_tokens_needed=20)
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    # a checkpoint saved after tokens are needed
+    path = tmp_path_factory.mktemp("checkpoint")
+    model = JournalModel(seed=1, output_format="none", **PARAMS)
+    for _ in range(30):
+        model.step()
+    model.save_checkpoint(str(path))
+    return str(path)
+
+
+def test_invalid_restore_leaves_no_output_files(checkpoint, tmp_path):
+    with pytest.raises(ValueError, match="initial_tokens"):
+        JournalModel(checkpoint=checkpoint, output_dir=str(tmp_path), **dict(PARAMS, initial_tokens=2))
+    assert os.listdir(tmp_path) == []
+
+
+def test_restore_writes_output_files(checkpoint, tmp_path):
+    model = JournalModel(checkpoint=checkpoint, output_dir=str(tmp_path), **PARAMS)
+    model.step()
+    model.close()
+    assert sorted(name.split("-")[0] for name in os.listdir(tmp_path)) == ["csv", "log"]
+    # the CSV file is a plain table, and the seed is in the log file
+    assert pd.read_csv(model.metrics_fname)["Step"].tolist() == [31]
+    with open(model.metrics_fname.replace("csv-", "log-").replace(".csv", ".txt")) as f:
+        assert f"Seed {model.seed}" in f.read()
+
+
+@pytest.mark.parametrize("changed", [dict(num_authors=400), dict(max_yearly_reviews_per_author_distribution="Yes"),
+                                     dict(num_days_with_no_tokens_needed=10), dict(no_tokens_to_submit=True), dict(prob_2_reviews=0.5)])
+def test_restore_rejects_other_parameters(checkpoint, changed):
+    with pytest.raises(ValueError, match=next(iter(changed))):
+        JournalModel(checkpoint=checkpoint, output_format="none", **dict(PARAMS, **changed))
+
+
+def test_restore_changes_acceptance(checkpoint):
+    model = JournalModel(checkpoint=checkpoint, output_format="none", **dict(PARAMS, prob_accept_L=0.3))
+    assert model.prob_accept_review_invitation[0] == 0.3
@@ -0,0 +1,112 @@
+from collections import Counter
+import numpy as np
+import pytest
+from journals import MultiJournalModel, Journal
+from run import ENGINES
+
+PARAMS = dict(num_authors=500, max_yearly_reviews_per_author_distribution="No", num_days_with_no_tokens_needed=100, output_format="none")
+SINGLE_PROCESS_ENGINES = ["agents", "vectorized", "cohort"]
+
+
+def capped(engine):
+    # the "No" distribution has no maximum yearly reviews; these caps (0 is no maximum) bind for some researchers
+    class Capped(ENGINES[engine]):
+        def researchers_max_yearly_reviews(self):
+            return np.random.default_rng(0).integers(3, 20, size=self.num_authors) * (np.arange(self.num_authors) % 5 != 0)
+    Capped.__name__ = ENGINES[engine].__name__
+    return Capped
+
+
+def run(model, days):
+    for _ in range(days):
+        model.step()
+    return model.metrics.to_dataframe()
+
+
+@pytest.mark.parametrize("engine", SINGLE_PROCESS_ENGINES)
+def test_same_seed_same_metrics(engine):
+    first, second, other = (run(ENGINES[engine](seed=seed, **PARAMS), 200) for seed in (7, 7, 8))
+    assert first.equals(second)
+    assert not first.equals(other)
+
+
+@pytest.mark.parametrize("engine", SINGLE_PROCESS_ENGINES)
+def test_checkpoint_continues_run(engine, tmp_path):
+    model = ENGINES[engine](seed=11, **PARAMS)
+    run(model, 150)
+    model.save_checkpoint(str(tmp_path / "checkpoint"))
+    restored = ENGINES[engine](checkpoint=str(tmp_path / "checkpoint"), **PARAMS)
+    assert run(restored, 150).equals(run(model, 150))
+
+
+def journals_run(processes, seed=7):
+    model = MultiJournalModel(journals=(Journal(0.6, 0.73, 1), Journal(0.4, 0.5, 2)), processes=processes, seed=seed, **PARAMS)
+    try:
+        return run(model, 200), model.num_tokens.copy()
+    finally:
+        model.close()
+
+
+def test_journals_same_metrics_with_workers():
+    metrics, tokens = journals_run(0)
+    assert metrics.equals(journals_run(0)[0])
+    workers_metrics, workers_tokens = journals_run(2)
+    assert workers_metrics.equals(metrics)
+    np.testing.assert_array_equal(workers_tokens, tokens)
+
+
+def check_cohorts(model):
+    for cohort, (tokens, cap, yearly_reviews) in enumerate(model.cohort_keys):
+        # every member of a cohort with yearly reviews has a record of their expiry days
+        assert len(model.cohort_members.get(cohort, ())) == (model.cohort_sizes[cohort] if yearly_reviews else 0)
+    for cohort, expiries in model.idle_records.values():
+        assert len(expiries) == model.cohort_keys[cohort][2] and expiries == sorted(expiries)
+        assert expiries[0] > model.global_step
+    for slot, expiries in model.slot_expiries.items():
+        assert len(expiries) == model.yearly_reviews[slot] and min(expiries) > model.global_step
+    assert model.cohort_sizes.total + len(model.materialized) == model.num_researchers
+
+
+def test_cohort_expiries_consistent():
+    model = capped("cohort")(seed=4, **PARAMS)
+    for day in range(600):
+        model.step()
+        if day % 25 == 0:
+            check_cohorts(model)
+    assert model.idle_records
+
+
+def check_warm_start(model):
+    # the reviews to do are those of the papers' pending reviewers, the submitted papers are either
+    # waiting for reviewers or in review, and no reviewer is over their maximum yearly reviews
+    arrays, _ = model.researchers_state()
+    rows = Counter(zip(arrays["review_reviewer"].tolist(), arrays["review_paper"].tolist()))
+    pending = Counter((rid, paper.ID) for paper in model.submitted_papers_dict.values() for rid, done in paper.reviewers if done == -1)
+    assert rows == pending and rows
+    if hasattr(model, "num_papers_to_review"):
+        np.testing.assert_array_equal(np.bincount(arrays["review_reviewer"], minlength=len(model.num_papers_to_review)), model.num_papers_to_review)
+    waiting, in_review = set(model.papers_waiting_reviewers), set(model.papers_in_review)
+    assert not waiting & in_review and waiting | in_review == set(model.submitted_papers_dict) and in_review
+    caps = getattr(model, "max_yearly_reviews", None)
+    caps = model.researchers_max_yearly_reviews() if caps is None else caps
+    assert ((arrays["yearly_reviews"] <= caps) | (caps == 0)).all()
+    for cohort, (tokens, cap, yearly_reviews) in enumerate(getattr(model, "cohort_keys", ())):
+        assert yearly_reviews <= cap or cap == 0 or model.cohort_sizes[cohort] == 0
+
+
+@pytest.mark.filterwarnings("error")
+@pytest.mark.parametrize("engine", SINGLE_PROCESS_ENGINES)
+def test_warm_start_consistent(engine):
+    model = capped(engine)(seed=5, backlog_of_papers_to_review=-1, **PARAMS)
+    model.build_population()
+    check_warm_start(model)
+
+
+@pytest.mark.parametrize("engine", SINGLE_PROCESS_ENGINES)
+def test_checkpoint_continues_warm_start(engine, tmp_path):
+    params = dict(PARAMS, backlog_of_papers_to_review=-1)
+    model = capped(engine)(seed=6, **params)
+    run(model, 100)
+    model.save_checkpoint(str(tmp_path / "checkpoint"))
+    restored = capped(engine)(checkpoint=str(tmp_path / "checkpoint"), **params)
+    assert run(restored, 150).equals(run(model, 150))
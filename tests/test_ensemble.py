@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from ensemble import EnsembleStats
+
+
+def random_runs(num_runs, num_steps, seed=0):
+    # (runs, steps, 2) values, NaN where a run does not cover a step: one run in three covers a random range of steps
+    rng = np.random.default_rng(seed)
+    data = np.full((num_runs, num_steps, 2), np.nan)
+    for run in range(num_runs):
+        start, stop = sorted(rng.integers(0, num_steps + 1, size=2)) if run % 3 == 0 else (0, num_steps)
+        data[run, start:stop] = np.column_stack([rng.normal(10, 2, stop - start), rng.normal(-3, 0.5, stop - start)])
+    return data
+
+
+def ensemble(data, capacity=8):
+    # the statistics of the runs, added one at a time; capacity is small so that add() resizes
+    stats = EnsembleStats(["a", "b"], capacity=capacity)
+    for run in data:
+        steps = np.flatnonzero(~np.isnan(run[:, 0]))
+        stats.add(steps, run[steps])
+    return stats
+
+
+def reference_quantiles(data, quantiles):
+    return np.moveaxis(np.nanquantile(data, quantiles, axis=0), 0, -1)
+
+
+def test_mean_and_std_match_numpy():
+    data = random_runs(300, 40)
+    stats = ensemble(data)
+    assert stats.num_steps == 40
+    np.testing.assert_array_equal(stats.count[:40], (~np.isnan(data[:, :, 0])).sum(axis=0))
+    np.testing.assert_allclose(stats.mean[:40], np.nanmean(data, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(stats.std(), np.nanstd(data, axis=0, ddof=1), rtol=1e-10)
+
+
+def test_quantiles_close_to_numpy():
+    data = random_runs(300, 40, seed=1)
+    stats = ensemble(data)
+    # P² is approximate: a few hundred runs give tail quantiles within about a third of a standard deviation
+    error = np.abs(stats.quantile() - reference_quantiles(data, stats.quantiles))
+    assert (error < 0.4 * np.nanstd(data, axis=0)[:, :, None]).all()
+
+
+@pytest.mark.parametrize("num_runs", [1, 2, 3, 4, 5])
+def test_quantiles_exact_up_to_five_runs(num_runs):
+    # step 0 has no runs, and step i > 0 the first min(i, num_runs) runs
+    data = np.random.default_rng(num_runs).normal(size=(num_runs, 6, 2))
+    for run in range(num_runs):
+        data[run, :run + 1] = np.nan
+    stats = ensemble(data)
+    estimates, reference = stats.quantile(), reference_quantiles(data[:, 1:], stats.quantiles)
+    assert np.isnan(estimates[0]).all()
+    np.testing.assert_allclose(estimates[1:], reference, rtol=1e-12)
+
+
+def test_dataframe_columns():
+    stats = ensemble(random_runs(10, 5, seed=2))
+    table = stats.to_dataframe()
+    assert list(table.columns[:2]) == ["Step", "Runs"]
+    assert {"a mean", "a std", "a 5%", "a 50%", "a 95%", "b mean"} <= set(table.columns)
+    assert len(table) == 5
+
+
+def test_save_load_round_trip(tmp_path):
+    data = random_runs(50, 30, seed=3)
+    stats = ensemble(data[:25])
+    path = str(tmp_path / "ensemble.npz")
+    stats.save(path, run_ids=np.arange(25))
+    loaded, extra = EnsembleStats.load(path)
+    np.testing.assert_array_equal(extra["run_ids"], np.arange(25))
+    assert loaded.columns == stats.columns and loaded.num_steps == stats.num_steps
+    for name in EnsembleStats.STATE:
+        np.testing.assert_array_equal(getattr(loaded, name)[:loaded.num_steps], getattr(stats, name)[:stats.num_steps])
+    # a resumed ensemble continues exactly as if it had not been saved
+    for run in data[25:]:
+        steps = np.flatnonzero(~np.isnan(run[:, 0]))
+        stats.add(steps, run[steps])
+        loaded.add(steps, run[steps])
+    assert loaded.to_dataframe().equals(stats.to_dataframe())
+
+
+def test_add_run_from_metrics_rows():
+    rows = np.zeros(4, dtype=[("Step", np.int64), ("a", np.int64), ("b", np.float64)])
+    rows["Step"], rows["a"], rows["b"] = [0, 1, 2, 3], [1, 2, 3, 4], [0.5, 1.5, 2.5, 3.5]
+    stats = EnsembleStats(["a", "b"])
+    stats.add_run(rows)
+    stats.add_run(rows[:2])
+    np.testing.assert_array_equal(stats.count[:4], [2, 2, 1, 1])
+    np.testing.assert_allclose(stats.mean[:4], [[1, 0.5], [2, 1.5], [3, 2.5], [4, 3.5]])
+
+
+def test_stopped_run_carried_forward():
+    rows = np.zeros(4, dtype=[("Step", np.int64), ("a", np.int64), ("b", np.float64)])
+    rows["Step"], rows["a"], rows["b"] = [0, 1, 2, 3], [1, 2, 3, 4], [0.5, 1.5, 2.5, 3.5]
+    stats = EnsembleStats(["a", "b"])
+    stats.add_run(rows, until=3)
+    stats.add_run(rows[:2], until=3)
+    np.testing.assert_array_equal(stats.count[:4], [2, 2, 2, 2])
+    np.testing.assert_array_equal(stats.stopped[:4], [0, 0, 1, 1])
+    np.testing.assert_allclose(stats.mean[:4], [[1, 0.5], [2, 1.5], [2.5, 2], [3, 2.5]])
+    assert stats.to_dataframe()["Runs stopped"].tolist() == [0, 0, 1, 1]
@@ -0,0 +1,48 @@
+import numpy as np
+from metrics import MetricsStore
+from stopping import StoppingRule, STOPPING_COLUMNS
+
+LEVELS = np.array([1000.0, 400.0, 80.0])
+
+
+def checks(series, rule=None, start_step=0):
+    # the day and reason of every check of the rule that would stop a run with these daily values of STOPPING_COLUMNS
+    rule = rule or StoppingRule()
+    metrics = MetricsStore(dict({"Step": np.int64}, **{name: np.float64 for name in STOPPING_COLUMNS}))
+    stops = []
+    for day, values in enumerate(series):
+        metrics.record((day,) + tuple(values))
+        reason = rule.check(metrics, start_step)
+        if reason is not None:
+            stops.append((day, reason))
+    return stops
+
+
+def noisy(num_days, seed=0):
+    return LEVELS + np.random.default_rng(seed).normal(size=(num_days, 3)) * LEVELS / 50
+
+
+def test_flat_noisy_series_settles():
+    stops = checks(noisy(800))
+    assert stops[0][0] == 390  # the first check with a full window
+    assert all(reason.startswith("steady state") for _, reason in stops)
+
+
+def test_linear_ramp_diverges():
+    series = noisy(800) - LEVELS + np.arange(800)[:, None] * LEVELS / 200
+    stops = checks(series)
+    assert stops[0][0] == 390 and stops[0][1].startswith("diverged")
+
+
+def test_step_change_does_not_settle_within_window():
+    rule = StoppingRule()
+    series = noisy(1500, seed=1)
+    series[600:] *= 1.3
+    stops = [day for day, reason in checks(series, rule) if reason.startswith("steady state")]
+    # no steady state from the first check after the change until it is about to leave the window
+    assert not [day for day in stops if 600 < day <= 600 + rule.window - rule.check_every]
+    assert stops[-1] == 1470  # settled again once the window is past the change
+
+
+def test_no_check_before_start_step():
+    assert not [day for day, _ in checks(noisy(800), start_step=300) if day < 300 + 365]
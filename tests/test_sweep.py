@@ -0,0 +1,30 @@
+import os
+import pandas as pd
+import sweep
+
+PARAMS = dict(num_authors=200, max_yearly_reviews_per_author_distribution="No")
+simulate = sweep.simulate
+
+
+def crashing_simulate(run, *args):
+    # the worker process running run 3 dies, as if killed for lack of memory
+    if run["run_id"] == 3:
+        os._exit(1)
+    return simulate(run, *args)
+
+
+def test_sweep_survives_crashed_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(sweep, "simulate", crashing_simulate)
+    output_dir = str(tmp_path)
+    failures = sweep.sweep({"initial_tokens": [2, 3]}, 4, 20, output_dir, processes=2, fixed=PARAMS)
+    with open(os.path.join(output_dir, "failed.txt")) as f:
+        failed = {int(line.split("\t")[0]) for line in f}
+    completed = set(pd.read_csv(os.path.join(output_dir, "results.csv"))["run_id"])
+    assert 3 in failed and failures == len(failed)
+    assert completed | failed == set(range(8)) and not completed & failed
+    assert max(completed) > max(failed)  # runs were submitted to the new pool after the crash
+
+    # resuming retries the failed runs
+    monkeypatch.setattr(sweep, "simulate", simulate)
+    assert sweep.sweep({"initial_tokens": [2, 3]}, 4, 20, output_dir, processes=2, fixed=PARAMS) == 0
+    assert set(pd.read_csv(os.path.join(output_dir, "results.csv"))["run_id"]) == set(range(8))
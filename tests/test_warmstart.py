@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from warmstart import assign_reviewers
+
+
+def test_assign_reviewers_respects_caps():
+    rng = np.random.default_rng(0)
+    caps = rng.integers(3, 20, size=500) * (np.arange(500) % 5 != 0)
+    steps = rng.integers(-400, 1, size=4000)  # the reviews accepted more than 365 days ago do not count
+    reviewers = assign_reviewers(steps, caps, 500, rng)
+    yearly_reviews = np.bincount(reviewers[steps >= -365], minlength=500)
+    assert ((yearly_reviews <= caps) | (caps == 0)).all()
+
+
+def test_assign_reviewers_warns_over_capacity():
+    rng = np.random.default_rng(1)
+    steps = rng.integers(-365, 1, size=500)
+    with pytest.warns(RuntimeWarning, match="300 of the 500 reviews"):
+        reviewers = assign_reviewers(steps, np.full(100, 2), 100, rng)
+    assert (np.bincount(reviewers, minlength=100) >= 2).all()
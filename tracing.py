@@ -0,0 +1,75 @@
+# tracing.py
+
+import pickle
+
+CATEGORIES = ("generation", "review", "submission", "status", "invites")
+
+
+class Tracer:
+    """Buffered event log with per-category enable flags.
+
+    Every category is a boolean attribute, so that a trace point costs a single check when its
+    category is disabled; trace points are written as
+
+        if __debug__ and self.trace.review:
+            self.trace.log("review", "Agent %s reviewed paper %s", agent.unique_id, paper_id)
+
+    and are removed altogether when Python runs with -O.
+    Messages are %-formatted only when the buffer is flushed; arguments must not be mutated
+    afterwards (pass a copy of lists). In text mode the messages are written to `logger`, in
+    binary mode the raw events are pickled to `path` and can be read back with read_trace().
+    """
+
+    def __init__(self, categories=(), logger=None, path=None, binary=False, buffer_size=100000):
+        for category in categories:
+            if category not in CATEGORIES:
+                raise ValueError(f"{category} is not a trace category; use one of {CATEGORIES}")
+        for category in CATEGORIES:
+            setattr(self, category, category in categories)
+        self.enabled = len(categories) > 0
+        self.logger = logger
+        self.binary = binary
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.step = 0
+        self.file = open(path, "wb") if self.enabled and binary and path is not None else None
+
+    def log(self, category, msg, *args):
+        self.buffer.append((self.step, category, msg, args))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.binary:
+            if self.file is None:  # no trace file
+                self.buffer = []
+                return
+            pickle.dump(self.buffer, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+        else:
+            self.logger.debug("\n".join(format_event(*event) for event in self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def format_event(step, category, msg, args):
+    return f"{step}\t{category}\t{msg % args if args else msg}"
+
+
+def read_trace(path):
+    # yields the events of a binary trace as (step, category, message)
+    with open(path, "rb") as f:
+        while True:
+            try:
+                events = pickle.load(f)
+            except EOFError:
+                return
+            for step, category, msg, args in events:
+                yield step, category, msg % args if args else msg
@@ -0,0 +1,74 @@
+# validate.py
+#
+# Compares the macro metrics of two engines over replicate runs, e.g.:
+#   python validate.py --engines agents cohort --days 1095 --replicates 10 --set num_days_with_no_tokens_needed=365
+# For every metric and window of days, the mean of the window is averaged over the replicates of each
+# engine; a difference is reported when it is both significant (Welch z-score above --threshold) and
+# larger than --tolerance relative to the reference engine. Exits with an error if any is reported.
+
+import argparse
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from run import ENGINES
+from sweep import make_runs, simulate, parse_value
+
+
+def window_means(engine, runs, days, window, processes):
+    # (replicates, windows, metrics) array of the metrics averaged over each window of days
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+        results = list(executor.map(simulate, runs, [days] * len(runs), [engine] * len(runs), [os.devnull] * len(runs)))
+    metrics = [name for name in results[0][0].dtype.names if name != "Step"]
+    means = []
+    for rows, _ in results:
+        values = np.column_stack([rows[name] for name in metrics]).astype(float)[1:]  # the first row is the initial state
+        means.append([values[start:start + window].mean(axis=0) for start in range(0, len(values), window)])
+    return metrics, np.array(means)
+
+
+def compare(reference, other, metrics, window, threshold, tolerance):
+    # returns the number of differences reported
+    differences = 0
+    mean_a, mean_b = reference.mean(axis=0), other.mean(axis=0)
+    se = np.sqrt(reference.var(axis=0, ddof=1) / len(reference) + other.var(axis=0, ddof=1) / len(other))
+    for w in range(mean_a.shape[0]):
+        for m, name in enumerate(metrics):
+            a, b = mean_a[w, m], mean_b[w, m]
+            z = (b - a) / se[w, m] if se[w, m] > 0 else (0.0 if a == b else np.inf)
+            relative = abs(b - a) / abs(a) if a else abs(b - a)
+            flag = ""
+            if abs(z) > threshold and relative > tolerance:
+                flag = "  DIFFERENT"
+                differences += 1
+            print(f"days {w * window + 1:>5}-{(w + 1) * window:<5} {name:32} {a:12.2f} {b:12.2f} ({relative:6.1%}, z {z:6.2f}){flag}")
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the metrics of two engines of the peer-review simulation over replicate runs")
+    parser.add_argument("--engines", nargs=2, choices=ENGINES.keys(), default=["agents", "cohort"], metavar=("REFERENCE", "OTHER"))
+    parser.add_argument("--days", type=int, default=730, help="number of simulated days of each run")
+    parser.add_argument("--replicates", type=int, default=10, help="number of runs of each engine")
+    parser.add_argument("--window", type=int, default=73, help="days averaged together")
+    parser.add_argument("--threshold", type=float, default=4.0, help="z-score of the differences reported")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="relative difference of the differences reported")
+    parser.add_argument("--processes", type=int, help="number of worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0, help="root seed of the runs' random streams")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="parameter value for every run")
+    args = parser.parse_args()
+
+    fixed = {}
+    for item in args.set:
+        name, value = item.split("=", 1)
+        fixed[name] = parse_value(name, value)
+    runs = make_runs({}, args.replicates, args.seed, fixed)
+    results = [window_means(engine, runs, args.days, args.window, args.processes) for engine in args.engines]
+    metrics = results[0][0]
+    print(f"{'':18}{'metric':32} {args.engines[0]:>12} {args.engines[1]:>12}")
+    differences = compare(results[0][1], results[1][1], metrics, args.window, args.threshold, args.tolerance)
+    print(f"{differences} differences")
+    raise SystemExit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    main()
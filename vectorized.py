@@ -0,0 +1,247 @@
+# vectorized.py
+
+import numpy as np
+from model import JournalModel
+from agents import Paper, LAZY, EAGER
+from indexed import IndexedSet
+from checkpoint import arrays_to_steps
+
+
+class VectorizedJournalModel(JournalModel):
+    """JournalModel engine keeping the researchers' state in NumPy arrays (struct-of-arrays).
+
+    Paper generation, review completion, token accounting and Lazy/Eager transitions are run
+    as batched array operations once per day; Python code only visits the researchers that
+    have something to do (papers to submit with enough tokens, reviews to anticipate).
+    Researchers are identified by their id, which is also the index in every array.
+    """
+
+    def init_researchers(self):
+        max_yearly_reviews = self.researchers_max_yearly_reviews()
+        n = len(max_yearly_reviews)
+        self.num_researchers = n
+        self.max_yearly_reviews = np.array(max_yearly_reviews, dtype=np.int64)
+        self.num_tokens = np.full(n, self.initial_tokens, dtype=np.int64)
+        self.status = np.full(n, LAZY, dtype=np.int8)
+        self.prev_status = np.full(n, LAZY, dtype=np.int8)
+        self.num_papers_to_submit = np.zeros(n, dtype=np.int64)
+        self.tokens_to_submit = np.zeros(n, dtype=np.int64)  # tokens required by the papers to submit
+        self.num_papers_to_review = np.zeros(n, dtype=np.int64)
+        self.yearly_reviews = np.zeros(n, dtype=np.int64)  # reviews accepted in the last 365 days
+        self.yearly_generations = np.zeros(n, dtype=np.int64)  # papers generated in the last 365 days
+        self.papers_to_submit = dict()  # maps researcher id to the papers waiting for tokens
+
+        # Reviews to do, one row per accepted review in order of acceptance
+        self.rev_paper = np.zeros(0, dtype=np.int64)
+        self.rev_reviewer = np.zeros(0, dtype=np.int64)
+        self.rev_scheduled = np.zeros(0, dtype=np.int64)
+        self.rev_accepted = np.zeros(0, dtype=np.int64)
+
+    RESEARCHER_ARRAYS = ("num_tokens", "status", "prev_status", "num_papers_to_submit", "tokens_to_submit", "num_papers_to_review",
+                         "yearly_reviews", "yearly_generations")
+
+    def researchers_state(self):
+        arrays = {name: getattr(self, name) for name in self.RESEARCHER_ARRAYS}
+        arrays.update(review_paper=self.rev_paper, review_reviewer=self.rev_reviewer, review_scheduled=self.rev_scheduled, review_accepted=self.rev_accepted)
+        return arrays, [paper for rid in sorted(self.papers_to_submit) for paper in self.papers_to_submit[rid]]
+
+    def restore_researchers(self, arrays, pending_papers):
+        # the arrays of the checkpoint are kept as they are (copy-on-write memory maps, see read_checkpoint)
+        self.init_researchers()
+        for name in self.RESEARCHER_ARRAYS:
+            setattr(self, name, np.asarray(arrays[name], dtype=getattr(self, name).dtype))
+        self.rev_paper = np.asarray(arrays["review_paper"])
+        self.rev_reviewer = np.asarray(arrays["review_reviewer"])
+        self.rev_scheduled = np.asarray(arrays["review_scheduled"])
+        self.rev_accepted = np.asarray(arrays["review_accepted"])
+        for paper in pending_papers:
+            self.papers_to_submit.setdefault(paper.author_id, []).append(paper)
+        self.reviews_accepted_per_step = arrays_to_steps("reviews_accepted", arrays, as_lists=False)
+        self.papers_generated_per_step = arrays_to_steps("papers_generated", arrays, as_lists=False)
+
+    def warm_start_researchers(self, arrays):
+        self.rev_paper, self.rev_reviewer, self.rev_scheduled, self.rev_accepted = (np.array(arrays[f"review_{name}"], dtype=np.int64)
+                                                                                    for name in ("paper", "reviewer", "scheduled", "accepted"))
+        self.num_papers_to_review = np.bincount(self.rev_reviewer, minlength=self.num_researchers)
+        self.yearly_reviews = np.bincount(arrays["reviews_accepted_id"], minlength=self.num_researchers)
+        self.yearly_generations = np.bincount(arrays["papers_generated_id"], minlength=self.num_researchers)
+        self.reviews_accepted_per_step = arrays_to_steps("reviews_accepted", arrays, as_lists=False)
+        self.papers_generated_per_step = arrays_to_steps("papers_generated", arrays, as_lists=False)
+
+    def expire_yearly_counts(self, step):
+        expired = self.reviews_accepted_per_step.pop(step, None)
+        if expired is not None:
+            np.subtract.at(self.yearly_reviews, expired, 1)
+        expired = self.papers_generated_per_step.pop(step, None)
+        if expired is not None:
+            np.subtract.at(self.yearly_generations, expired, 1)
+
+    def researchers_actions(self):
+        self.generate_papers()
+        self.do_reviews()
+        self.submit_papers()
+        self.update_status()
+
+    def generate_papers(self):
+        self.write_papers(np.flatnonzero(self.rng_generation.random(self.num_researchers) < self.daily_submission_prob))
+
+    def write_papers(self, authors):
+        # each of the (unique) authors writes a new paper
+        num_reviews = self.draw_num_reviews(len(authors))
+        for author_id, nr in zip(authors.tolist(), num_reviews.tolist()):
+            new_paper = Paper(
+                ID=self.next_paper_id,
+                generation_step=self.global_step,
+                submission_step=None,
+                author_id=author_id,
+                num_reviews=nr,
+            )
+            self.next_paper_id += 1
+            self.papers_to_submit.setdefault(author_id, []).append(new_paper)
+        np.add.at(self.num_papers_to_submit, authors, 1)
+        np.add.at(self.tokens_to_submit, authors, num_reviews)
+        self.yearly_generations[authors] += 1  # authors are unique
+        self.papers_generated_per_step[self.global_step] = authors
+        if __debug__ and self.trace.generation:
+            self.trace.log("generation", '%s agents wrote a new paper', len(authors))
+
+    def draw_num_reviews(self, n):
+        # reviews required by the next n papers
+        return self.num_reviews_sampler.sample_many(n, self.rng_generation)
+
+    def do_reviews(self):
+        due = self.rev_scheduled == self.global_step
+        if not due.any():
+            return
+        rows = np.flatnonzero(due)
+        reviewers = self.rev_reviewer[rows]
+        credits = np.zeros(len(rows), dtype=np.int64)
+        for i, (paper_id, rid) in enumerate(zip(self.rev_paper[rows].tolist(), reviewers.tolist())):
+            paper = self.submitted_papers_dict.get(paper_id)
+            if paper:
+                for j, (reviewer_id, done) in enumerate(paper.reviewers):
+                    if reviewer_id == rid:
+                        if done == -1:
+                            paper.num_reviews_done += 1
+                        paper.reviewers[j] = (rid, self.global_step)
+                        credits[i] += 1
+                self.check_paper_reviewed(paper)
+            else:
+                if __debug__ and self.trace.review:
+                    self.trace.log("review", "ERROR - Agent %s was supposed to review paper %s but paper's id was not found in the global list of submitted papers", rid, paper_id)
+
+        if self.tokens_needed_to_submit():
+            np.add.at(self.num_tokens, reviewers, credits)
+        np.subtract.at(self.num_papers_to_review, reviewers, 1)
+        self.moving_average_rev_time.add(int(credits.sum()), int((credits * (self.global_step - self.rev_accepted[rows])).sum()))
+        if __debug__ and self.trace.review:
+            self.trace.log("review", '%s reviews were done', len(rows))
+
+        keep = ~due
+        self.rev_paper = self.rev_paper[keep]
+        self.rev_reviewer = self.rev_reviewer[keep]
+        self.rev_scheduled = self.rev_scheduled[keep]
+        self.rev_accepted = self.rev_accepted[keep]
+
+    def submit_papers(self):
+        tokens_needed = self.tokens_needed_to_submit()
+        ready = self.num_papers_to_submit > 0
+        if tokens_needed:
+            ready &= self.num_tokens >= 2  # every paper needs at least 2 reviews
+        for author_id in np.flatnonzero(ready).tolist():
+            papers = self.papers_to_submit[author_id]
+            num_tokens = int(self.num_tokens[author_id])
+            papers_ready = []
+            for paper in papers:
+                if not tokens_needed or paper.num_reviews <= num_tokens:
+                    self.submit_paper(paper)
+                    papers_ready.append(paper)
+                    if tokens_needed:
+                        num_tokens -= paper.num_reviews
+            if len(papers_ready) == len(papers):
+                del self.papers_to_submit[author_id]
+            else:
+                self.papers_to_submit[author_id] = [paper for paper in papers if paper.submission_step is None]
+            self.num_tokens[author_id] = num_tokens
+            self.num_papers_to_submit[author_id] -= len(papers_ready)
+            self.tokens_to_submit[author_id] -= sum(paper.num_reviews for paper in papers_ready)
+
+    def update_status(self):
+        self.prev_status[:] = self.status
+        if not self.tokens_needed_to_submit():
+            self.status[:] = LAZY
+            return
+        tokens_missing = self.tokens_to_submit - self.num_tokens
+        needs_reviews = tokens_missing > 0
+        self.status[~needs_reviews] = LAZY
+        self.status[needs_reviews & (self.num_papers_to_review == 0)] = EAGER
+
+        # Researchers with assigned reviews anticipate them to earn the missing tokens
+        authors = np.flatnonzero(needs_reviews & (self.num_papers_to_review > 0))
+        if len(authors) == 0:
+            return
+        rows = np.flatnonzero(np.isin(self.rev_reviewer, authors))
+        rows = rows[np.argsort(self.rev_reviewer[rows], kind="stable")]
+        bounds = np.flatnonzero(np.diff(self.rev_reviewer[rows])) + 1
+        for author_rows in np.split(rows, bounds):
+            author_id = int(self.rev_reviewer[author_rows[0]])
+            token_needed = int(tokens_missing[author_id])
+            review_time_sampler = self.review_time_sampler[self.status[author_id]]
+            for row in author_rows.tolist():
+                if token_needed <= 0:
+                    break
+                new_review_time = self.global_step + review_time_sampler.sample(self.random_review_times)
+                if self.rev_scheduled[row] > new_review_time:
+                    self.rev_scheduled[row] = new_review_time
+                    token_needed -= 1
+            if token_needed > 0:
+                self.status[author_id] = EAGER
+
+    def author_needs_reviews_to_publish(self, author):
+        return self.tokens_needed_to_submit() and self.tokens_to_submit[author] > self.num_tokens[author]
+
+    def get_reviewers_reviews_in_timeframe(self, author):
+        return self.yearly_reviews[author]
+
+    def get_authors_generations_in_timeframe(self, author):
+        return self.yearly_generations[author]
+
+    def reviewer_can_review(self, author):
+        return self.max_yearly_reviews[author] == 0 or self.status[author] == EAGER or self.yearly_reviews[author] < self.max_yearly_reviews[author]
+
+    def accepts_invitation(self, paper, reviewer, accept):
+        return self.reviewer_can_review(reviewer) and accept <= self.prob_accept_review_invitation[self.status[reviewer]]
+
+    def add_reviewer(self, paper, reviewer, eager_researchers):
+        # the reviewing times of the day's reviews are drawn at once by assign_reviews()
+        status = self.status[reviewer]
+        self.new_reviews.append((paper.ID, reviewer, status))
+        self.yearly_reviews[reviewer] += 1
+        paper.reviewers.append((reviewer, -1))
+        if status == EAGER and self.author_needs_reviews_to_publish(reviewer):
+            self.status[reviewer] = LAZY
+            eager_researchers.remove(reviewer)
+
+    def assign_reviews(self):
+        # Get eager reviewer to give them priority
+        eager_researchers = IndexedSet(np.flatnonzero(self.status == EAGER).tolist())
+        self.new_reviews = new_reviews = []  # (paper_id, reviewer_id, status when accepting)
+        self.invites_sent_in_step = self.invite_reviewers(eager_researchers)
+        self.schedule_reviews(new_reviews)
+        if __debug__ and self.trace.invites:
+            self.trace.log("invites", '%s reviews were accepted', len(new_reviews))
+
+    def schedule_reviews(self, new_reviews):
+        # the reviews accepted in the day, as (paper_id, reviewer_id, status when accepting), are added to the reviews to do
+        if new_reviews:
+            paper_ids, reviewers, statuses = (np.array(col, dtype=np.int64) for col in zip(*new_reviews))
+            review_iter = np.empty(len(new_reviews), dtype=np.int64)
+            for status in (LAZY, EAGER):
+                reviews = statuses == status
+                review_iter[reviews] = self.review_time_sampler[status].sample_many(np.count_nonzero(reviews), self.rng_review_times)
+            np.add.at(self.num_papers_to_review, reviewers, 1)
+            self.rev_paper = np.concatenate([self.rev_paper, paper_ids])
+            self.rev_reviewer = np.concatenate([self.rev_reviewer, reviewers])
+            self.rev_scheduled = np.concatenate([self.rev_scheduled, self.global_step + review_iter])
+            self.rev_accepted = np.concatenate([self.rev_accepted, np.full(len(new_reviews), self.global_step)])
+            self.reviews_accepted_per_step[self.global_step] = reviewers
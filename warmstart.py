@@ -0,0 +1,195 @@
+# warmstart.py
+#
+# In-flight state of a run at the equilibrium of the period before tokens are needed, generated in
+# bulk instead of simulated, so that a run can start with full queues rather than spend its first
+# year or more filling them:
+#   JournalModel(backlog_of_papers_to_review=-1, ...)   # the papers in review at the equilibrium
+#   JournalModel(backlog_of_papers_to_review=40000, ...)  # 40000 papers in review
+# The arrays have the names used by checkpoints (see checkpoint.py).
+
+import warnings
+import numpy as np
+from agents import LAZY
+
+BLOCK_DAYS = 30  # days of submissions generated at once
+MAX_HISTORY_DAYS = 3650  # submissions older than this are not generated, even if still in review
+CAP_ROUNDS = 20  # rounds of redraws of the reviews exceeding the maximum yearly reviews of their reviewer
+
+
+def review_lifecycles(model, sub, rng):
+    # for papers submitted at the given steps: their number of reviews, and for every review (grouped by
+    # paper) the step it is accepted, the step it is done and the invitations sent until it is accepted
+    p_accept = model.prob_accept_review_invitation[LAZY]
+    num_reviews = model.num_reviews_sampler.sample_many(len(sub), rng)
+    review_sub = np.repeat(sub, num_reviews)
+    n = len(review_sub)
+    # A missing review gets invitations on 1 day out of 7 (see draw_invitations), 1 to
+    # num_invites_per_review of them, until one is accepted: the invitations are geometric, and the
+    # days with invitations needed to send them are followed by geometric gaps
+    invites = rng.geometric(p_accept, size=n)
+    days_with_invites = np.maximum(np.rint(invites / invites_per_day(model.num_invites_per_review)), 1).astype(np.int64)
+    accepted = review_sub + days_with_invites - 1 + rng.negative_binomial(days_with_invites, 1 / 7)
+    done = accepted + model.review_time_sampler[LAZY].sample_many(n, rng)
+    return num_reviews, accepted, done, invites
+
+
+def invites_per_day(num_invites_per_review):
+    # mean invitations of a missing review on a day with invitations: min(geometric(6/7) - 1, n), if positive
+    k = np.arange(1, num_invites_per_review + 1)
+    probability = (1 / 7) ** k * np.where(k < num_invites_per_review, 6 / 7, 1.0)
+    return float((k * probability).sum() / probability.sum())
+
+
+def warm_state(model, backlog, rng):
+    """Papers in review, reviews to do and histories of the last 365 days at step 0.
+
+    Papers are submitted every day of the past by a binomial number of researchers, and go through
+    the invitations of Lazy reviewers (the only ones before tokens are needed) and their reviewing
+    times; the papers still in review at step 0 are kept, with their reviewers and the reviews done,
+    and the earlier ones only contribute to the histories of the last 365 days (reviews accepted and
+    done, papers assigned and generated). With backlog > 0, backlog papers in review are drawn among
+    those of the equilibrium (all of them with backlog=-1). The maximum number of yearly reviews of
+    the reviewers is enforced as far as the researchers invited can do the reviews (a RuntimeWarning
+    reports the others), but not its effect on the invitations, so with max yearly reviews the
+    queues are a bit shorter than those of a simulated warm-up.
+    """
+    caps = model.researchers_max_yearly_reviews()
+    num_researchers, num_candidates = len(caps), model.num_authors  # reviewers are invited among the first num_authors
+    history = np.arange(-365, 1)
+
+    # Past submissions, a block of days at a time going back, until a block leaves nothing in review
+    # nor in the last 365 days: of the earlier papers only the histories are kept
+    accepted_steps, generated = [], np.zeros(len(history), dtype=np.int64)
+    done_counts, done_totals = np.zeros(len(history), dtype=np.int64), np.zeros(len(history), dtype=np.int64)
+    assigned_counts, assigned_totals = np.zeros(len(history), dtype=np.int64), np.zeros(len(history), dtype=np.int64)
+    pending = []  # (submission step, number of reviews, accepted, done, invites) of the blocks' papers in review
+    end = 1
+    while end > 1 - MAX_HISTORY_DAYS:
+        days = np.arange(end - BLOCK_DAYS, end)
+        sub = np.repeat(days, rng.binomial(num_researchers, model.daily_submission_prob, size=len(days)))
+        end -= BLOCK_DAYS
+        recent = days >= -365
+        generated[days[recent] + 365] += np.bincount(sub - days[0], minlength=len(days))[recent]
+        if len(sub) == 0:
+            continue
+        num_reviews, accepted, done, invites = review_lifecycles(model, sub, rng)
+        starts = np.concatenate(([0], np.cumsum(num_reviews)[:-1]))
+        paper_finished = np.maximum.reduceat(done, starts) <= 0
+        finished = np.repeat(paper_finished, num_reviews)
+        accepted_steps.append(accepted[finished & (accepted >= -365)])
+        add_done_reviews(done_counts, done_totals, accepted[finished], done[finished])
+        add_assigned_papers(assigned_counts, assigned_totals, np.maximum.reduceat(accepted, starts)[paper_finished],
+                            np.add.reduceat(invites, starts)[paper_finished])
+        if not finished.all():
+            pending.append((sub[~paper_finished], num_reviews[~paper_finished], accepted[~finished], done[~finished], invites[~finished]))
+        elif end < -365 and (done < -365).all():
+            break
+
+    # Papers in review, in order of submission
+    sub, num_reviews, accepted, done, invites = (np.concatenate([block[i] for block in pending]) if pending else np.zeros(0, dtype=np.int64) for i in range(5))
+    starts = np.concatenate(([0], np.cumsum(num_reviews)[:-1])).astype(np.int64)
+    if backlog < 0:
+        chosen = np.arange(len(sub))
+    elif len(sub):
+        chosen = rng.choice(len(sub), size=backlog, replace=backlog > len(sub))
+    else:
+        chosen = np.zeros(0, dtype=np.int64)
+    chosen = chosen[np.argsort(sub[chosen], kind="stable")]
+    sub, num_reviews, starts = sub[chosen], num_reviews[chosen], starts[chosen]
+    rows = np.repeat(starts, num_reviews) + np.arange(num_reviews.sum()) - np.repeat(np.cumsum(num_reviews) - num_reviews, num_reviews)
+    accepted, done, invites = accepted[rows], done[rows], invites[rows]
+    paper = np.repeat(np.arange(len(sub)), num_reviews)
+
+    # Reviews accepted so far, in order of acceptance within each paper; invitations of the missing
+    # ones in proportion to the days elapsed
+    is_assigned = accepted <= 0
+    is_done = done <= 0
+    invites_sent = np.where(is_assigned, invites, invites * (1 - sub[paper]) // np.maximum(accepted - sub[paper] + 1, 1))
+    num_invites = np.bincount(paper, weights=invites_sent, minlength=len(sub)).astype(np.int64)
+    num_reviewers = np.bincount(paper[is_assigned], minlength=len(sub))
+    in_review = num_reviewers == num_reviews
+    assigned = np.full(len(sub), np.iinfo(np.int64).min)
+    np.maximum.at(assigned, paper, np.where(is_assigned, accepted, np.iinfo(np.int64).min))
+    add_done_reviews(done_counts, done_totals, accepted[is_done], done[is_done])
+    add_assigned_papers(assigned_counts, assigned_totals, assigned[in_review], num_invites[in_review])
+
+    # Reviewers: those of the papers in review first, then the others of the last 365 days; a reviewer
+    # with a maximum takes at most that many reviews in the 365 days
+    review_rows = np.flatnonzero(is_assigned)
+    review_rows = review_rows[np.lexsort((accepted[review_rows], paper[review_rows]))]
+    steps = np.concatenate([accepted[review_rows]] + accepted_steps)
+    reviewers = assign_reviewers(steps, caps, num_candidates, rng)
+
+    arrays = dict()
+    ids = np.arange(1, len(sub) + 1, dtype=np.int64)
+    arrays["paper_id"] = ids
+    arrays["paper_generation_step"] = sub
+    arrays["paper_submission_step"] = sub
+    arrays["paper_submitted"] = np.ones(len(sub), dtype=bool)
+    arrays["paper_author"] = rng.integers(num_researchers, size=len(sub))
+    arrays["paper_num_reviews"] = num_reviews
+    arrays["paper_num_invites"] = num_invites
+    arrays["paper_num_reviews_done"] = np.bincount(paper[is_done], minlength=len(sub))
+    arrays["paper_num_reviewers"] = num_reviewers
+    arrays["paper_reviewer"] = reviewers[:len(review_rows)]
+    # -1 marks the reviews not done yet, so those done on day -1 are recorded on day -2 (the day is not used otherwise)
+    done_steps = np.where(done[review_rows] == -1, -2, done[review_rows])
+    arrays["paper_reviewer_done"] = np.where(is_done[review_rows], done_steps, -1)
+    arrays["paper_in_review"] = ids[in_review][np.argsort(assigned[in_review], kind="stable")]
+
+    # Reviews to do, in order of acceptance
+    to_do = np.flatnonzero(~is_done[review_rows])
+    to_do = to_do[np.argsort(accepted[review_rows][to_do], kind="stable")]
+    arrays["review_paper"] = ids[paper[review_rows][to_do]]
+    arrays["review_reviewer"] = reviewers[to_do]
+    arrays["review_scheduled"] = done[review_rows][to_do]
+    arrays["review_accepted"] = accepted[review_rows][to_do]
+
+    # Histories of the last 365 days, in order of step
+    in_window = steps >= -365
+    order = np.argsort(steps[in_window], kind="stable")
+    arrays["reviews_accepted_step"] = steps[in_window][order]
+    arrays["reviews_accepted_id"] = reviewers[in_window][order]
+    arrays["papers_generated_step"] = np.repeat(history, generated)
+    arrays["papers_generated_id"] = rng.integers(num_researchers, size=int(generated.sum()))
+    arrays["rev_time_count"], arrays["rev_time_total"] = done_counts, done_totals
+    arrays["inv_per_pap_count"], arrays["inv_per_pap_total"] = assigned_counts, assigned_totals
+    return arrays
+
+
+def add_done_reviews(counts, totals, accepted, done):
+    # reviews done in the last 365 days, and their reviewing times, by day
+    recent = done >= -365
+    np.add.at(counts, done[recent] + 365, 1)
+    np.add.at(totals, done[recent] + 365, (done - accepted)[recent])
+
+
+def add_assigned_papers(counts, totals, assigned, invites):
+    # papers that got all their reviewers in the last 365 days, and their invitations, by day
+    recent = assigned >= -365
+    np.add.at(counts, assigned[recent] + 365, 1)
+    np.add.at(totals, assigned[recent] + 365, invites[recent])
+
+
+def assign_reviewers(steps, caps, num_candidates, rng):
+    # a uniform reviewer for each review accepted at the given steps; the reviews of the last 365 days
+    # exceeding the maximum yearly reviews of their reviewer (0 is no maximum) are given to reviewers
+    # below their maximum, as invitations refused by reviewers at their maximum would be
+    reviewers = rng.integers(num_candidates, size=len(steps))
+    caps = caps[:num_candidates]
+    limited = caps > 0
+    rows = np.flatnonzero(steps >= -365)
+    for attempt in range(CAP_ROUNDS + 1):
+        rows = rows[np.argsort(reviewers[rows], kind="stable")]
+        ids = reviewers[rows]
+        over = rows[limited[ids] & (np.arange(len(rows)) - np.searchsorted(ids, ids) >= caps[ids])]
+        if len(over) == 0:
+            return reviewers
+        spare = np.flatnonzero(~limited | (np.bincount(ids, minlength=num_candidates) < caps))
+        if len(spare) == 0 or attempt == CAP_ROUNDS:
+            break
+        reviewers[over] = spare[rng.integers(len(spare), size=len(over))]
+    reason = f"the {num_candidates} researchers invited cannot do them all" if len(spare) == 0 else f"still after {CAP_ROUNDS} rounds of redraws"
+    warnings.warn(f"warm start: {len(over)} of the {len(rows)} reviews accepted in the last 365 days exceed the maximum yearly reviews "
+                  f"of their reviewer ({reason}); use a smaller backlog_of_papers_to_review", RuntimeWarning)
+    return reviewers
@@ -0,0 +1,53 @@
+# windows.py
+
+class SlidingWindow:
+    """Sums of (count, total) pairs collected day by day over sliding windows of past days.
+
+    Days are kept in a ring buffer as long as the largest window, and a running sum is kept
+    for every window, so that adding a value, moving to the next day and querying a window
+    all cost O(1) regardless of the window length.
+    A window of `days` days at step t covers steps t-days to t (both included).
+    """
+
+    def __init__(self, windows=(30, 365)):
+        self.windows = tuple(windows)
+        self.size = max(self.windows) + 1
+        self.counts = [0] * self.size
+        self.totals = [0] * self.size
+        self.sum_counts = {days: 0 for days in self.windows}
+        self.sum_totals = {days: 0 for days in self.windows}
+        self.step = 0
+
+    def advance(self, step):
+        # move to a new day, dropping the days that exit each window
+        for day in range(self.step + 1, step + 1):
+            for days in self.windows:
+                old = (day - days - 1) % self.size
+                self.sum_counts[days] -= self.counts[old]
+                self.sum_totals[days] -= self.totals[old]
+            self.counts[day % self.size] = 0
+            self.totals[day % self.size] = 0
+        self.step = max(self.step, step)
+
+    def add(self, count, total):
+        # collect a value for the current day
+        self.counts[self.step % self.size] += count
+        self.totals[self.step % self.size] += total
+        for days in self.windows:
+            self.sum_counts[days] += count
+            self.sum_totals[days] += total
+
+    def count_today(self):
+        return self.counts[self.step % self.size]
+
+    def total_today(self):
+        return self.totals[self.step % self.size]
+
+    def count(self, days):
+        return self.sum_counts[days]
+
+    def total(self, days):
+        return self.sum_totals[days]
+
+    def mean(self, days):
+        return self.sum_totals[days] / self.sum_counts[days] if self.sum_counts[days] > 0 else 0